@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from images.cleanup import OrphanImageCleanupService
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes images no recipe or ingredient references, with their variants "
+        "and stored files, in batches. Meant to run on a schedule, e.g. nightly "
+        "from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Report what would be deleted without deleting it.")
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help="Images deleted per transaction and storage batch.")
+        parser.add_argument('--grace-hours', type=int, default=settings.IMAGE_GC_GRACE_HOURS,
+                            help="Leave images uploaded within this many hours.")
+        parser.add_argument('--limit', type=int,
+                            help="Stop after this many images.")
+
+    def handle(self, *args, **options):
+        verb = "would be deleted" if options['dry_run'] else "deleted"
+
+        def progress(stats):
+            self.stdout.write(
+                f"{stats['images_deleted']} images and {stats['files_deleted']} files {verb}, "
+                f"{stats['bytes_freed'] / 1024 / 1024:.1f} MB")
+
+        try:
+            service = OrphanImageCleanupService(
+                batch_size=options['batch_size'], grace_hours=options['grace_hours'],
+                dry_run=options['dry_run'], progress=progress)
+            stats = service.collect(limit=options['limit'])
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        seconds = max(stats['seconds'], 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['images_deleted']} orphan images {verb} in {stats['seconds']:.1f}s "
+            f"({stats['images_deleted'] / seconds:.0f} images/s, "
+            f"{stats['files_deleted'] / seconds:.0f} files/s)"))
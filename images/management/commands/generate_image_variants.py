@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from images.models import Image
+from images.services import ImageVariantService
+
+
+class Command(BaseCommand):
+    help = (
+        "Renders the missing IMAGE_VARIANT_WIDTHS variants of stored images, "
+        "for images uploaded before variants existed or after the widths or "
+        "format changed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--image', type=int, action='append', dest='image_ids',
+                            help="Only this image id, can be repeated.")
+
+    def handle(self, *args, **options):
+        # pending uploads have no file yet; images that have every configured
+        # variant, or were already rendered for these settings with some
+        # widths skipped, are passed over without opening them
+        images = Image.objects.filter(status='ready').exclude(
+            variant_spec=ImageVariantService.variant_spec()
+        ).annotate(variant_count=Count(
+            'variants', filter=Q(variants__format=settings.IMAGE_VARIANT_FORMAT,
+                                 variants__width__in=settings.IMAGE_VARIANT_WIDTHS))
+        ).filter(variant_count__lt=len(set(settings.IMAGE_VARIANT_WIDTHS))).order_by('id')
+        if options['image_ids']:
+            images = images.filter(id__in=options['image_ids'])
+
+        service = ImageVariantService()
+        created = failed = 0
+        for image_id in images.values_list('id', flat=True).iterator():
+            try:
+                created += len(service.generate_variants(image_id))
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Image {image_id}: {e}")
+        self.stdout.write(self.style.SUCCESS(
+            f"{created} variants created, {failed} images failed"))
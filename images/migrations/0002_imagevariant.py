@@ -0,0 +1,32 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageVariant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('webp', 'WEBP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='variants', to='images.image')),
+            ],
+            options={
+                'verbose_name': 'Image Variant',
+                'verbose_name_plural': 'Image Variants',
+                'constraints': [models.UniqueConstraint(fields=('image', 'format', 'width'), name='imagevariant_unique_width')],
+            },
+        ),
+    ]
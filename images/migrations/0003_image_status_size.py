@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_imagevariant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready')], default='ready', max_length=10),
+        ),
+    ]
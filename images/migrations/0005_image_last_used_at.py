@@ -0,0 +1,26 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:38
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def copy_created_at(apps, schema_editor):
+    # existing images were last used when they were uploaded
+    Image = apps.get_model('images', 'Image')
+    Image.objects.update(last_used_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_image_digest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='last_used_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_last_used_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='variant_spec',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
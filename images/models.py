@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User as AuthUser
 
 
@@ -24,7 +25,21 @@ class Image(models.Model):
         on_delete=models.CASCADE,
         related_name='images_uploaded'
     )
+    # direct uploads stay pending until the client finalizes them
+    status = models.CharField(
+        max_length=10,
+        choices=[('pending', 'Pending'), ('ready', 'Ready')],
+        default='ready')
+    size = models.PositiveIntegerField(blank=True, null=True)
+    # SHA-256 of the file, identical uploads share one image
+    digest = models.CharField(max_length=64, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # moved on when an identical upload reuses the image, orphan cleanup
+    # counts its grace period from here
+    last_used_at = models.DateTimeField(default=timezone.now)
+    # IMAGE_VARIANT_FORMAT and widths the variants were last rendered for,
+    # so widths skipped for small or unreadable originals are not retried
+    variant_spec = models.CharField(max_length=255, blank=True, null=True)
 
     def __str__(self):
         return f"Image {self.id} - {self.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
@@ -33,3 +48,30 @@ class Image(models.Model):
         verbose_name = "Image"
         verbose_name_plural = "Images"
         ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['digest'], condition=models.Q(digest__isnull=False),
+                                    name='image_unique_digest'),
+        ]
+
+
+class ImageVariant(models.Model):
+    image = models.ForeignKey(
+        Image, on_delete=models.CASCADE, related_name='variants')
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(
+        max_length=10, choices=[('webp', 'WEBP'), ('jpeg', 'JPEG')])
+    name = models.CharField(max_length=255)
+    size = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.image} - {self.width}w {self.format}"
+
+    class Meta:
+        verbose_name = "Image Variant"
+        verbose_name_plural = "Image Variants"
+        constraints = [
+            models.UniqueConstraint(fields=['image', 'format', 'width'],
+                                    name='imagevariant_unique_width'),
+        ]
@@ -5,4 +5,6 @@ from .models import Image
 class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
-        fields = '__all__'
+        # deduplication shares an image between the users who uploaded the
+        # same file, so its uploader and digest are not exposed
+        exclude = ['uploaded_by', 'digest', 'last_used_at']
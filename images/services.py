@@ -1,53 +1,54 @@
-from .models import Image
-from azure.storage.blob import BlobServiceClient, ContentSettings, generate_blob_sas, BlobSasPermissions
-from datetime import datetime, timedelta
-from django.conf import settings
+from .models import Image, ImageVariant
+from .storage import get_storage
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from io import BytesIO
-import environ
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import FilteredRelation, Q
+from PIL import Image as PillowImage, ImageOps, UnidentifiedImageError
+import hashlib
+import logging
+import mimetypes
+import threading
 import uuid
 
-# Initialize environment variables
-env = environ.Env()
-
-
-class AzureBlobService:
-    def __init__(self):
-        self.connection_string = env('AZURE_BLOB_CONNECTION_STRING')
-        self.client = BlobServiceClient.from_connection_string(
-            self.connection_string)
-        self.container = self.client.get_container_client(
-            env('AZURE_STORAGE_CONTAINER_NAME'))
-
-    def upload(self, blob_name, file, content_type="application/octet-stream"):
-        blob_client = self.container.get_blob_client(blob_name)
-        blob_client.upload_blob(
-            file,  content_settings=ContentSettings(content_type=content_type))
-        return blob_client.url
-
-    def delete(self, blob_name):
-        self.container.delete_blob(blob_name)
-
-    def generate_sas_url(self, blob_name, content_disposition=None, expiry_minutes=15):
-        blob_client = self.container.get_blob_client(blob_name)
-
-        # Create SAS token with content disposition
-        sas_token = generate_blob_sas(
-            account_name=env('AZURE_STORAGE_ACCOUNT_NAME'),
-            container_name=env('AZURE_STORAGE_CONTAINER_NAME'),
-            blob_name=blob_name,
-            account_key=env('AZURE_STORAGE_KEY'),
-            permission=BlobSasPermissions(read=True),
-            expiry=datetime.utcnow() + timedelta(minutes=expiry_minutes),
-            content_disposition=content_disposition  # Add content disposition
-        )
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+
+NO_IMAGE_URLS = {'image_url': None, 'thumbnail_url': None, 'srcset': None}
+
+# Pillow's format name for each accepted extension
+IMAGE_FORMATS = dict(Image._meta.get_field('extension').choices)
+
+
+def file_digest(file):
+    """
+    SHA-256 hex digest of an uploaded file, read chunk by chunk.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
 
-        # Construct the full URL with SAS token
-        return f"{blob_client.url}?{sas_token}"
+
+def set_image_urls(target, urls):
+    """
+    Copies image_url, thumbnail_url and srcset onto a model instance or a
+    values() row. Missing urls set all three to None.
+    """
+    urls = urls or NO_IMAGE_URLS
+    if isinstance(target, dict):
+        target.update(urls)
+    else:
+        for key, value in urls.items():
+            setattr(target, key, value)
 
 
 class ImageService:
-    def __init__(self, user):
-        self.azure_blob_service = AzureBlobService()
+    def __init__(self, user=None):
+        self.storage = get_storage()
         self.user = user
 
     def upload_image(self, image_file, user):
@@ -55,7 +56,7 @@ class ImageService:
             raise ValueError("No image file provided")
 
         # chek file size is less than 5MB
-        if image_file.size > 5 * 1024 * 1024:  #
+        if image_file.size > MAX_IMAGE_SIZE:
             raise ValueError("Image file size exceeds 5MB limit")
 
         # get the file extension
@@ -66,33 +67,310 @@ class ImageService:
 
         extension = image_file.name.split('.')[-1].lower()
 
-        # Create a unique blob name
+        # an identical file is already stored, reuse its image and skip
+        # the upload. Marking it used restarts the orphan cleanup's grace
+        # period, and updates nothing when the cleanup deleted it meanwhile
+        digest = file_digest(image_file)
+        image = Image.objects.filter(digest=digest).first()
+        if image is not None:
+            image.last_used_at = datetime.now(timezone.utc)
+            if Image.objects.filter(id=image.id).update(last_used_at=image.last_used_at):
+                return image
+
+        # Create a unique blob name, a name derived from the content could be
+        # reused while the cleanup of an earlier image by it still deletes it
         blob_name = f"{str(uuid.uuid4())}.{extension}"
 
-        # Upload the image to Azure Blob Storage
-        url = self.azure_blob_service.upload(blob_name, image_file)
+        # Upload the image to the storage backend
+        image_file.seek(0)
+        url = self.storage.upload(blob_name, image_file)
 
         # Save the image metadata to the database
+        try:
+            with transaction.atomic():
+                image = Image.objects.create(
+                    name=blob_name,
+                    extension=image_file.name.split('.')[-1],
+                    uploaded_by=user,
+                    size=image_file.size,
+                    digest=digest
+                )
+        except IntegrityError:
+            # the same file was stored by a concurrent upload
+            self.storage.delete(blob_name)
+            return Image.objects.get(digest=digest)
+        schedule_variants(image.id)
+        return image
+
+    def create_upload(self, filename, user):
+        """
+        Starts a direct upload: records a pending image and returns it with
+        a write-only URL the client PUTs the file to, bypassing the app
+        servers. The upload is committed by finalize_upload.
+        """
+        if not filename:
+            raise ValueError("Image file name is required")
+        if '.' not in filename:
+            raise ValueError("Image file name must have an extension")
+
+        extension = filename.split('.')[-1].lower()
+        # finalize_upload checks the file with Pillow, which can't read svg
+        if extension not in IMAGE_FORMATS or extension == 'svg':
+            raise ValueError("Unsupported image file extension")
+
         image = Image.objects.create(
-            name=blob_name,
-            extension=image_file.name.split('.')[-1],
-            uploaded_by=user
+            name=f"{str(uuid.uuid4())}.{extension}",
+            extension=extension,
+            uploaded_by=user,
+            status='pending'
         )
-        return image
+        expiry = datetime.now(timezone.utc) + timedelta(
+            minutes=settings.IMAGE_UPLOAD_URL_MINUTES)
+        upload = self.storage.sign_upload(
+            image.name, mimetypes.guess_type(image.name)[0] or 'application/octet-stream', expiry)
+        upload['expires_at'] = expiry
+        return image, upload
 
-    def get_image_url(self, image_id):
+    def finalize_upload(self, image_id, user):
+        """
+        Checks that the client's direct upload arrived within the size limit
+        and is an image of the type its extension names, and marks the image
+        ready. A file that fails the checks is deleted with its image.
+        Finalizing a ready image returns it as is.
+        """
         try:
-            image = Image.objects.get(id=image_id)
-            blob_name = f"{image.name}"
-            return self.azure_blob_service.generate_sas_url(blob_name)
+            image = Image.objects.get(id=image_id, uploaded_by=user)
         except Image.DoesNotExist:
             raise ValueError("Image not found")
+        if image.status == 'ready':
+            return image
+
+        stat = self.storage.stat(image.name)
+        if stat is None:
+            raise ValueError("Image has not been uploaded")
+        try:
+            if stat['size'] > MAX_IMAGE_SIZE:
+                raise ValueError("Image file size exceeds 5MB limit")
+            self._verify_upload(image, stat)
+        except ValueError:
+            self.storage.delete(image.name)
+            image.delete()
+            raise
+
+        # a concurrent finalize of the same image only updates it once
+        updated = Image.objects.filter(id=image.id, status='pending').update(
+            status='ready', size=stat['size'])
+        image.status = 'ready'
+        image.size = stat['size']
+        if updated:
+            schedule_variants(image.id)
+        return image
+
+    def _verify_upload(self, image, stat):
+        # the upload URL doesn't pin the content type, and the stored one is
+        # what the file is later served as
+        if stat['content_type'] != mimetypes.guess_type(image.name)[0]:
+            raise ValueError("Image content type does not match its extension")
+
+        # the size was checked first, so this reads at most MAX_IMAGE_SIZE
+        stream = self.storage.open(image.name)
+        try:
+            data = stream.read()
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+        try:
+            with PillowImage.open(BytesIO(data)) as source:
+                format = source.format
+                source.verify()
+        except (OSError, SyntaxError):
+            raise ValueError("Uploaded file is not a valid image")
+        if format != IMAGE_FORMATS[image.extension]:
+            raise ValueError("Image content does not match its extension")
+
+    def get_image_url_sets(self, image_ids):
+        """
+        Resolves a batch of image ids to their signed URLs with a single
+        query: the original as image_url, the smallest variant as
+        thumbnail_url (the original until variants exist) and all variants
+        of IMAGE_VARIANT_FORMAT as a srcset.
+        """
+        image_ids = {image_id for image_id in image_ids if image_id}
+        if not image_ids:
+            return {}
+
+        rows = Image.objects.filter(id__in=image_ids, status='ready').annotate(
+            variant=FilteredRelation(
+                'variants', condition=Q(variants__format=settings.IMAGE_VARIANT_FORMAT))
+        ).values_list('id', 'name', 'variant__width', 'variant__name').order_by(
+            'id', 'variant__width')
+
+        url_sets = {}
+        for image_id, name, width, variant_name in rows:
+            if image_id not in url_sets:
+                image_url = self.storage.signed_url(name)
+                url_sets[image_id] = {
+                    'image_url': image_url, 'thumbnail_url': image_url, 'srcset': []}
+            if variant_name is None:
+                continue
+            urls = url_sets[image_id]
+            variant_url = self.storage.signed_url(variant_name)
+            if not urls['srcset']:
+                urls['thumbnail_url'] = variant_url
+            urls['srcset'].append(f"{variant_url} {width}w")
+
+        for urls in url_sets.values():
+            urls['srcset'] = ', '.join(urls['srcset']) or None
+        return url_sets
+
+    def get_image_url_set(self, image_id):
+        # an image whose direct upload was never finalized has no URLs yet
+        return self.get_image_url_sets([image_id]).get(image_id, NO_IMAGE_URLS)
+
+    def get_attachable_image_url_set(self, image_id):
+        """
+        Returns the URLs of an image about to be attached to a recipe or an
+        ingredient, and rejects ids that are missing or whose direct upload
+        was never finalized. Call it before saving the row.
+        """
+        url_sets = self.get_image_url_sets([image_id])
+        if image_id not in url_sets:
+            raise ValueError("Image not found")
+        return url_sets[image_id]
 
     def delete_image(self, image_id):
         try:
             image = Image.objects.get(id=image_id)
-            self.azure_blob_service.delete(
-                f"images/{image.uploaded_by.id}/{image.name}")
+            self.storage.delete_many(
+                [image.name, *image.variants.values_list('name', flat=True)])
             image.delete()
         except Image.DoesNotExist:
             raise ValueError("Image not found")
+
+
+class ImageVariantService:
+    """
+    Renders the IMAGE_VARIANT_WIDTHS resized copies of an uploaded image in
+    IMAGE_VARIANT_FORMAT and records them as ImageVariant rows. Widths at or
+    above the original's are skipped, images are never upscaled.
+    """
+
+    formats = {
+        'webp': ('WEBP', 'image/webp'),
+        'jpeg': ('JPEG', 'image/jpeg'),
+    }
+
+    def __init__(self, storage=None):
+        self.storage = storage or get_storage()
+
+    @staticmethod
+    def variant_spec():
+        widths = ','.join(str(w) for w in sorted(set(settings.IMAGE_VARIANT_WIDTHS)))
+        return f"{settings.IMAGE_VARIANT_FORMAT}:{widths}"
+
+    def generate_variants(self, image_id):
+        format = settings.IMAGE_VARIANT_FORMAT
+        if format not in self.formats:
+            raise ValueError("IMAGE_VARIANT_FORMAT must be webp or jpeg")
+        pillow_format, content_type = self.formats[format]
+
+        try:
+            image = Image.objects.get(id=image_id)
+        except Image.DoesNotExist:
+            raise ValueError("Image not found")
+        existing = set(image.variants.filter(
+            format=format).values_list('width', flat=True))
+        widths = sorted(set(settings.IMAGE_VARIANT_WIDTHS) - existing)
+        if not widths:
+            self._mark_rendered(image)
+            return []
+
+        stream = self.storage.open(image.name)
+        try:
+            data = stream.read()
+        finally:
+            if hasattr(stream, 'close'):
+                stream.close()
+        try:
+            source = PillowImage.open(BytesIO(data))
+            # JPEGs decode straight at a reduced scale when even the largest
+            # variant is much smaller than the original
+            source.draft('RGB', (widths[-1], widths[-1]))
+            source = ImageOps.exif_transpose(source)
+        except (UnidentifiedImageError, OSError):
+            # svg, ico and damaged files are served as uploaded
+            self._mark_rendered(image)
+            return []
+        source = self._convert(source, format)
+
+        stem = image.name.rsplit('.', 1)[0]
+        variants = []
+        for width in widths:
+            if width >= source.width:
+                break
+            height = max(1, round(source.height * width / source.width))
+            output = BytesIO()
+            source.resize((width, height), PillowImage.Resampling.LANCZOS).save(
+                output, format=pillow_format, quality=settings.IMAGE_VARIANT_QUALITY)
+            name = f"{stem}_{width}w.{format}"
+            self.storage.upload(name, output.getvalue(), content_type)
+            variants.append(ImageVariant(
+                image=image, width=width, height=height, format=format,
+                name=name, size=output.tell()))
+
+        # a concurrent run for the same image keeps the rows it wrote first
+        variants = ImageVariant.objects.bulk_create(variants, ignore_conflicts=True)
+        self._mark_rendered(image)
+        return variants
+
+    def _mark_rendered(self, image):
+        Image.objects.filter(id=image.id).update(variant_spec=self.variant_spec())
+
+    def _convert(self, source, format):
+        if source.mode not in ('RGB', 'RGBA'):
+            has_alpha = source.mode in ('LA', 'PA') or 'transparency' in source.info
+            source = source.convert('RGBA' if has_alpha else 'RGB')
+        if format == 'jpeg' and source.mode == 'RGBA':
+            # JPEG has no alpha, flatten transparent images onto white
+            background = PillowImage.new('RGB', source.size, 'white')
+            background.paste(source, mask=source.getchannel('A'))
+            return background
+        return source
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_variant_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants')
+        return _executor
+
+
+def schedule_variants(image_id):
+    """
+    Generates the variants of an image once the transaction that created it
+    commits, on the worker pool, or inline when IMAGE_VARIANT_WORKERS is 0.
+    """
+    if settings.IMAGE_VARIANT_WORKERS == 0:
+        transaction.on_commit(
+            lambda: ImageVariantService().generate_variants(image_id), robust=True)
+    else:
+        transaction.on_commit(
+            lambda: get_variant_executor().submit(_generate_in_worker, image_id))
+
+
+def _generate_in_worker(image_id):
+    try:
+        ImageVariantService().generate_variants(image_id)
+    except Exception:
+        # the original stays usable, the backfill command retries later
+        logger.exception("Generating variants of image %s failed", image_id)
+    finally:
+        # worker threads own their connections, don't leave them open
+        connections.close_all()
@@ -0,0 +1,362 @@
+from abc import ABC, abstractmethod
+from azure.core.exceptions import ResourceNotFoundError
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import BlobServiceClient, ContentSettings, generate_blob_sas, BlobSasPermissions
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.urls import reverse
+from django.utils.crypto import constant_time_compare, salted_hmac
+from django.utils.module_loading import import_string
+from functools import cache
+from pathlib import Path
+from recipebuilder.metrics import record_azure_call
+from requests import Session
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlencode
+from urllib3.util.retry import Retry
+import environ
+import mimetypes
+import os
+import shutil
+import threading
+import time
+import uuid
+
+# Initialize environment variables
+env = environ.Env()
+
+
+class SignedUrlCache:
+    """
+    LRU cache of signed blob URLs keyed by blob name, content disposition and
+    lifetime. Expiries are aligned to fixed windows, so every request in the
+    same window gets the same URL, and it still has the full lifetime left
+    when the window ends and the URL is re-signed.
+    """
+
+    def __init__(self, max_size=4096, window_minutes=5):
+        self.max_size = max_size
+        self.window_seconds = window_minutes * 60
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current_window(self):
+        return int(time.time() // self.window_seconds)
+
+    def get_or_sign(self, key, expiry_minutes, sign):
+        window = self.current_window()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == window:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        expiry = datetime.fromtimestamp(
+            (window + 1) * self.window_seconds, tz=timezone.utc) + timedelta(minutes=expiry_minutes)
+        url = sign(expiry)
+
+        with self._lock:
+            self._entries[key] = (window, url)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._evict(window)
+        return url
+
+    def _evict(self, window):
+        # drop entries from past windows first, then the least recently used
+        for key in [key for key, entry in self._entries.items() if entry[0] != window]:
+            del self._entries[key]
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'max_size': self.max_size,
+            }
+
+
+sas_url_cache = SignedUrlCache(
+    max_size=env.int('AZURE_SAS_CACHE_SIZE', default=4096),
+    window_minutes=env.int('AZURE_SAS_WINDOW_MINUTES', default=5))
+
+
+class StorageBackend(ABC):
+    """
+    Where image files are kept. Backends store, read and delete files by
+    name and sign expiring read URLs for them, which are shared through
+    sas_url_cache. The backend in use is IMAGE_STORAGE_BACKEND.
+    """
+
+    @abstractmethod
+    def upload(self, name, file, content_type="application/octet-stream"):
+        """
+        Stores the contents of the binary stream `file` under `name`.
+        """
+
+    @abstractmethod
+    def delete(self, name):
+        """
+        Deletes the file.
+        """
+
+    def delete_many(self, names):
+        for name in names:
+            self.delete(name)
+
+    @abstractmethod
+    def open(self, name):
+        """
+        Returns a readable binary stream of the file.
+        """
+
+    @abstractmethod
+    def stat(self, name):
+        """
+        Returns the size and content type of a stored file, or None when
+        there is no file by that name.
+        """
+
+    @abstractmethod
+    def sign(self, name, content_disposition, expiry):
+        """
+        Returns a URL that reads the file until `expiry`.
+        """
+
+    @abstractmethod
+    def sign_upload(self, name, content_type, expiry):
+        """
+        Returns the URL, HTTP method and headers with which a client
+        writes the file itself until `expiry`.
+        """
+
+    def signed_url(self, name, content_disposition=None, expiry_minutes=15):
+        return sas_url_cache.get_or_sign(
+            (type(self).__name__, name, content_disposition, expiry_minutes), expiry_minutes,
+            lambda expiry: self.sign(name, content_disposition, expiry))
+
+
+class TimedRequestsTransport(RequestsTransport):
+    # every HTTP attempt, retries included, counts towards the request's
+    # Azure time in the metrics middleware
+    def send(self, request, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().send(request, **kwargs)
+        finally:
+            record_azure_call(time.perf_counter() - start)
+
+
+class AzureBlobStorage(StorageBackend):
+    # the blob client, its HTTP connection pool and the storage settings are
+    # shared by every instance in the process and built on first use
+    _container = None
+    _account_name = None
+    _account_key = None
+    _container_name = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_container_client(cls):
+        if cls._container is None:
+            with cls._lock:
+                if cls._container is None:
+                    cls._account_name = env('AZURE_STORAGE_ACCOUNT_NAME')
+                    cls._account_key = env('AZURE_STORAGE_KEY')
+                    cls._container_name = env('AZURE_STORAGE_CONTAINER_NAME')
+
+                    # retries are handled by the azure pipeline itself
+                    pool_size = env.int('AZURE_BLOB_POOL_SIZE', default=20)
+                    adapter = HTTPAdapter(
+                        pool_connections=pool_size,
+                        pool_maxsize=pool_size,
+                        max_retries=Retry(total=False, redirect=False,
+                                          raise_on_status=False))
+                    session = Session()
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+
+                    client = BlobServiceClient.from_connection_string(
+                        env('AZURE_BLOB_CONNECTION_STRING'),
+                        transport=TimedRequestsTransport(
+                            session=session, session_owner=False))
+                    cls._container = client.get_container_client(
+                        cls._container_name)
+        return cls._container
+
+    @property
+    def container(self):
+        return self.get_container_client()
+
+    def upload(self, blob_name, file, content_type="application/octet-stream"):
+        blob_client = self.container.get_blob_client(blob_name)
+        blob_client.upload_blob(
+            file,  content_settings=ContentSettings(content_type=content_type))
+        return blob_client.url
+
+    def delete(self, blob_name):
+        self.container.delete_blob(blob_name)
+
+    def delete_many(self, names):
+        # blob batch requests take at most 256 deletes each
+        names = list(names)
+        for start in range(0, len(names), 256):
+            self.container.delete_blobs(
+                *names[start:start + 256], raise_on_any_failure=False)
+
+    def open(self, blob_name):
+        return self.container.get_blob_client(blob_name).download_blob()
+
+    def stat(self, blob_name):
+        try:
+            properties = self.container.get_blob_client(
+                blob_name).get_blob_properties()
+        except ResourceNotFoundError:
+            return None
+        return {'size': properties.size,
+                'content_type': properties.content_settings.content_type}
+
+    def sign(self, blob_name, content_disposition, expiry):
+        blob_client = self.container.get_blob_client(blob_name)
+        # Create SAS token with content disposition
+        sas_token = generate_blob_sas(
+            account_name=self._account_name,
+            container_name=self._container_name,
+            blob_name=blob_name,
+            account_key=self._account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=expiry,
+            content_disposition=content_disposition  # Add content disposition
+        )
+
+        # Construct the full URL with SAS token
+        return f"{blob_client.url}?{sas_token}"
+
+    def sign_upload(self, blob_name, content_type, expiry):
+        blob_client = self.container.get_blob_client(blob_name)
+        # create only, the token can neither read the blob nor overwrite it
+        # once it exists
+        sas_token = generate_blob_sas(
+            account_name=self._account_name,
+            container_name=self._container_name,
+            blob_name=blob_name,
+            account_key=self._account_key,
+            permission=BlobSasPermissions(create=True),
+            expiry=expiry,
+        )
+        return {
+            'url': f"{blob_client.url}?{sas_token}",
+            'method': 'PUT',
+            'headers': {'x-ms-blob-type': 'BlockBlob',
+                        'x-ms-blob-content-type': content_type},
+        }
+
+
+class LocalFileStorage(StorageBackend):
+    """
+    Files on the local disk under LOCAL_STORAGE_ROOT, for development, load
+    tests and deployments without Azure. Signed URLs point at the
+    image-file view and carry an HMAC of the name, expiry and content
+    disposition made with SECRET_KEY.
+    """
+
+    salt = 'images.storage.LocalFileStorage'
+
+    def __init__(self, root=None, base_url=None):
+        self.root = Path(root or settings.LOCAL_STORAGE_ROOT).resolve()
+        self.base_url = settings.LOCAL_STORAGE_BASE_URL if base_url is None else base_url
+
+    def path(self, name):
+        path = (self.root / name).resolve()
+        if self.root not in path.parents:
+            raise ValueError("Invalid file name")
+        return path
+
+    def upload(self, name, file, content_type="application/octet-stream"):
+        path = self.path(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # written beside the target and renamed, readers never see half a file
+        partial = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+        with open(partial, 'wb') as out:
+            if isinstance(file, bytes):
+                out.write(file)
+            elif hasattr(file, 'chunks'):
+                for chunk in file.chunks():
+                    out.write(chunk)
+            else:
+                shutil.copyfileobj(file, out)
+        os.replace(partial, path)
+        return f"{self.base_url}{reverse('image-file', args=[name])}"
+
+    def delete(self, name):
+        self.path(name).unlink(missing_ok=True)
+
+    def open(self, name):
+        return open(self.path(name), 'rb')
+
+    def stat(self, name):
+        path = self.path(name)
+        if not path.is_file():
+            return None
+        return {'size': path.stat().st_size,
+                'content_type': mimetypes.guess_type(name)[0]}
+
+    def signature(self, name, expires, content_disposition, method='GET'):
+        value = f"{name}|{expires}|{content_disposition or ''}"
+        # upload URLs are signed apart, a read URL never grants a write
+        salt = self.salt if method == 'GET' else f"{self.salt}.{method}"
+        return salted_hmac(salt, value, algorithm='sha256').hexdigest()
+
+    def sign(self, name, content_disposition, expiry):
+        expires = int(expiry.timestamp())
+        query = {'expires': expires}
+        if content_disposition:
+            query['disposition'] = content_disposition
+        query['sig'] = self.signature(name, expires, content_disposition)
+        return f"{self.base_url}{reverse('image-file', args=[name])}?{urlencode(query)}"
+
+    def sign_upload(self, name, content_type, expiry):
+        expires = int(expiry.timestamp())
+        query = {'expires': expires, 'sig': self.signature(name, expires, None, 'PUT')}
+        return {
+            'url': f"{self.base_url}{reverse('image-upload-file', args=[name])}?{urlencode(query)}",
+            'method': 'PUT',
+            'headers': {'Content-Type': content_type},
+        }
+
+    def verify(self, name, expires, content_disposition, signature, method='GET'):
+        try:
+            expires = int(expires)
+        except (TypeError, ValueError):
+            return False
+        if expires < time.time():
+            return False
+        return constant_time_compare(
+            signature or '', self.signature(name, expires, content_disposition, method))
+
+
+@cache
+def get_storage():
+    return import_string(settings.IMAGE_STORAGE_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_storage(*, setting, **kwargs):
+    if setting in ('IMAGE_STORAGE_BACKEND', 'LOCAL_STORAGE_ROOT', 'LOCAL_STORAGE_BASE_URL'):
+        get_storage.cache_clear()
@@ -1,3 +1,258 @@
-from django.test import TestCase
+import tempfile
+from contextlib import nullcontext
+from unittest import mock
+from io import BytesIO, StringIO
+from datetime import datetime, timedelta, timezone
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from recipebuilder.testing import AuthenticatedAPITestCase
+from PIL import Image as PillowImage
+from recipes.models import Recipe
+from .cleanup import OrphanImageCleanupService
+from .models import Image, ImageVariant
+from .services import ImageService
+from .storage import LocalFileStorage, StorageBackend, sas_url_cache
 
-# Create your tests here.
+
+class LocalFileStorageTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings = override_settings(
+            IMAGE_STORAGE_BACKEND='images.storage.LocalFileStorage', LOCAL_STORAGE_ROOT=root.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        sas_url_cache.clear()
+
+    def upload(self, content=b'png-bytes', filename='photo.png'):
+        response = self.client.post('/images/upload/', {
+            'image': SimpleUploadedFile(filename, content)}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        return response.json()['id']
+
+    def test_signed_url_serves_the_file_without_login(self):
+        image_id = self.upload()
+        url = ImageService().get_image_url_set(image_id)['image_url']
+        self.client.force_authenticate(None)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'png-bytes')
+        self.assertEqual(response['Content-Type'], 'image/png')
+
+        self.assertEqual(self.client.get(url.replace('sig=', 'sig=0')).status_code, 403)
+        self.assertEqual(self.client.get(url.split('?')[0]).status_code, 403)
+
+    def test_expired_and_deleted_files_are_not_served(self):
+        image_id = self.upload()
+        service = ImageService()
+        expired = service.storage.sign(
+            Image.objects.get(id=image_id).name, None, datetime.now(timezone.utc) - timedelta(seconds=1))
+        self.assertEqual(self.client.get(expired).status_code, 403)
+
+        url = service.get_image_url_set(image_id)['image_url']
+        service.delete_image(image_id)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_identical_uploads_share_one_image(self):
+        image_id = self.upload()
+        Image.objects.filter(id=image_id).update(
+            last_used_at=datetime.now(timezone.utc) - timedelta(days=2))
+
+        response = self.client.post('/images/upload/', {
+            'image': SimpleUploadedFile('copy.png', b'png-bytes')}, format='multipart')
+        self.assertEqual(response.json()['id'], image_id)
+        self.assertFalse({'uploaded_by', 'digest'} & response.json().keys())
+        # reuse restarts the grace period, the orphan cleanup keeps the image
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(OrphanImageCleanupService().collect()['images_deleted'], 0)
+        self.assertNotEqual(self.upload(b'other-bytes'), image_id)
+        self.assertEqual(sorted(ImageService().storage.root.iterdir()),
+                         sorted(ImageService().storage.path(image.name) for image in Image.objects.all()))
+
+    def test_backends_must_implement_every_operation(self):
+        class ReadOnlyStorage(StorageBackend):
+            def open(self, name):
+                return BytesIO()
+
+        with self.assertRaisesMessage(TypeError, 'sign_upload'):
+            ReadOnlyStorage()
+
+    def test_names_cannot_leave_the_storage_root(self):
+        storage = ImageService().storage
+        with self.assertRaises(ValueError):
+            storage.path('../settings.py')
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0, IMAGE_VARIANT_WIDTHS=[160, 480, 960],
+                       IMAGE_VARIANT_FORMAT='webp')
+    def test_variants_are_rendered_after_upload(self):
+        original = BytesIO()
+        PillowImage.new('RGB', (800, 600), 'red').save(original, format='JPEG')
+        with self.captureOnCommitCallbacks(execute=True):
+            image_id = self.upload(original.getvalue(), 'photo.jpg')
+
+        # the 960 width would upscale the 800 pixel original
+        variants = ImageVariant.objects.filter(image_id=image_id).order_by('width')
+        self.assertEqual([(v.width, v.height) for v in variants], [(160, 120), (480, 360)])
+        service = ImageService()
+        with service.storage.open(variants[0].name) as file:
+            self.assertEqual(PillowImage.open(file).format, 'WEBP')
+
+        urls = service.get_image_url_set(image_id)
+        self.assertIn(variants[0].name, urls['thumbnail_url'])
+        self.assertEqual(urls['srcset'].count('w, '), 1)
+        self.assertTrue(urls['srcset'].endswith(' 480w'))
+
+        service.delete_image(image_id)
+        self.assertFalse(service.storage.path(variants[1].name).exists())
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0, IMAGE_VARIANT_WIDTHS=[160, 480, 960])
+    def test_variant_command_renders_each_ready_image_once(self):
+        original = BytesIO()
+        PillowImage.new('RGB', (800, 600), 'red').save(original, format='JPEG')
+        with self.captureOnCommitCallbacks():
+            image_id = self.upload(original.getvalue(), 'photo.jpg')
+        pending = Image.objects.create(
+            name='pending.jpg', extension='jpg', uploaded_by=self.user, status='pending')
+
+        with mock.patch.object(LocalFileStorage, 'open', wraps=ImageService().storage.open) as opened:
+            call_command('generate_image_variants', stdout=StringIO())
+            # the 960 width stays missing, the second run leaves the image alone
+            call_command('generate_image_variants', stdout=StringIO())
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(ImageVariant.objects.filter(image_id=image_id).count(), 2)
+        self.assertFalse(pending.variants.exists())
+
+        with override_settings(IMAGE_VARIANT_WIDTHS=[160, 320, 480, 960]):
+            call_command('generate_image_variants', stdout=StringIO())
+        self.assertEqual(ImageVariant.objects.filter(image_id=image_id).count(), 3)
+
+    @override_settings(IMAGE_VARIANT_WORKERS=0)
+    def test_unreadable_images_keep_only_the_original(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image_id = self.upload()
+
+        self.assertFalse(ImageVariant.objects.filter(image_id=image_id).exists())
+        urls = ImageService().get_image_url_set(image_id)
+        self.assertEqual(urls['thumbnail_url'], urls['image_url'])
+        self.assertIsNone(urls['srcset'])
+
+    def image_bytes(self, format='JPEG'):
+        output = BytesIO()
+        PillowImage.new('RGB', (40, 30), 'red').save(output, format=format)
+        return output.getvalue()
+
+    def direct_upload(self, filename, content, stat=None):
+        response = self.client.post('/images/uploads/', {'filename': filename}, format='json')
+        self.assertEqual(response.status_code, 201)
+        image_id, upload = response.json()['id'], response.json()['upload']
+        self.assertEqual(self.client.put(
+            upload['url'], content, content_type=upload['headers']['Content-Type']).status_code, 201)
+        with mock.patch.object(LocalFileStorage, 'stat', return_value=stat) if stat else nullcontext():
+            return self.client.post(f'/images/uploads/{image_id}/finalize/'), image_id
+
+    def test_direct_upload_is_finalized_after_the_client_puts_the_file(self):
+        jpeg = self.image_bytes()
+        response = self.client.post('/images/uploads/', {'filename': 'Photo.JPG'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        image_id, upload = response.json()['id'], response.json()['upload']
+        self.assertEqual(response.json()['status'], 'pending')
+        self.assertEqual(upload['method'], 'PUT')
+        self.assertIsNone(ImageService().get_image_url_set(image_id)['image_url'])
+
+        finalize = f'/images/uploads/{image_id}/finalize/'
+        self.assertEqual(self.client.post(finalize).json()['error'], "Image has not been uploaded")
+
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.put(
+            upload['url'].replace('sig=', 'sig=0'), jpeg,
+            content_type='image/jpeg').status_code, 403)
+        self.assertEqual(self.client.put(
+            upload['url'], jpeg, content_type='image/jpeg').status_code, 201)
+        self.assertEqual(self.client.put(
+            upload['url'], b'other-bytes', content_type='image/jpeg').status_code, 409)
+
+        self.client.force_authenticate(self.user)
+        response = self.client.post(finalize)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['status'], response.json()['size']), ('ready', len(jpeg)))
+        url = ImageService().get_image_url_set(image_id)['image_url']
+        self.assertEqual(b''.join(self.client.get(url).streaming_content), jpeg)
+
+    def test_direct_uploads_must_be_images_of_their_extension(self):
+        for filename, content, error in (
+                ('photo.jpg', b'not an image', "Uploaded file is not a valid image"),
+                ('photo.jpg', self.image_bytes('PNG'), "Image content does not match its extension"),
+                ('photo.png', self.image_bytes('PNG')[:60], "Uploaded file is not a valid image")):
+            with self.subTest(filename=filename, error=error):
+                response, image_id = self.direct_upload(filename, content)
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], error)
+                self.assertFalse(Image.objects.filter(id=image_id).exists())
+        self.assertEqual(list(ImageService().storage.root.iterdir()), [])
+
+        # the stored content type is what the file is served as later
+        response, _ = self.direct_upload(
+            'photo.jpg', self.image_bytes(), stat={'size': 10, 'content_type': 'text/html'})
+        self.assertEqual(response.json()['error'], "Image content type does not match its extension")
+
+        response = self.client.post('/images/uploads/', {'filename': 'logo.svg'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_pending_images_cannot_be_attached(self):
+        image_id = self.client.post(
+            '/images/uploads/', {'filename': 'photo.png'}, format='json').json()['id']
+        recipe = Recipe.objects.create(title='Soup', instructions='Boil', created_by=self.user)
+
+        for method, url, body in (
+                ('post', '/recipes/recipe/', {'title': 'Stew', 'instructions': 'Simmer'}),
+                ('put', f'/recipes/recipe/{recipe.id}/', {'title': 'Broth', 'instructions': 'Boil'}),
+                ('post', '/recipes/ingredient/', {'name': 'Salt', 'unit': 'g'})):
+            with self.subTest(method=method, url=url):
+                response = getattr(self.client, method)(
+                    url, {**body, 'image_id': image_id}, format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['error'], "Image not found")
+        self.assertEqual(list(Recipe.objects.values_list('title', 'image_id')), [('Soup', None)])
+
+        # a row that already points at a pending image reads without URLs
+        Recipe.objects.filter(id=recipe.id).update(image_id=image_id)
+        response = self.client.get(f'/recipes/recipe/{recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['data']['image_url'])
+
+    def test_upload_after_cleanup_stores_a_new_file(self):
+        image_id = self.upload()
+        name = Image.objects.get(id=image_id).name
+        Image.objects.filter(id=image_id).delete()
+
+        # the deleted image's file is removed after commit, the new upload
+        # must not have been written under the same name
+        new_id = self.upload(filename='again.png')
+        self.assertNotEqual(new_id, image_id)
+        ImageService().storage.delete(name)
+        url = ImageService().get_image_url_set(new_id)['image_url']
+        self.assertEqual(b''.join(self.client.get(url).streaming_content), b'png-bytes')
+
+    def test_orphan_images_are_deleted_in_batches(self):
+        kept, recent = self.upload(b'kept'), self.upload(b'recent')
+        orphans = [self.upload(b'a'), self.upload(b'b')]
+        Recipe.objects.create(title='Soup', instructions='Boil', image_id=kept, created_by=self.user)
+        Image.objects.exclude(id=recent).update(
+            last_used_at=datetime.now(timezone.utc) - timedelta(days=2))
+        names = dict(Image.objects.values_list('id', 'name'))
+        storage = ImageService().storage
+
+        call_command('delete_orphan_images', '--dry-run', stdout=StringIO())
+        self.assertEqual(Image.objects.count(), 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            stats = OrphanImageCleanupService(batch_size=1).collect()
+        self.assertEqual(
+            (stats['images_deleted'], stats['files_deleted'], stats['bytes_freed']), (2, 2, 2))
+        self.assertEqual(set(Image.objects.values_list('id', flat=True)), {kept, recent})
+        self.assertFalse(any(storage.path(names[id]).exists() for id in orphans))
+        self.assertTrue(storage.path(names[kept]).exists())
@@ -1,5 +1,11 @@
 from django.urls import path
-from .views import ImageUploadView
+from .views import (ImageUploadView, ImageUploadSessionView, ImageUploadFinalizeView,
+                    local_upload_view, local_file_view)
 urlpatterns = [
     path('upload/', ImageUploadView.as_view(), name='image-upload'),
+    path('uploads/', ImageUploadSessionView.as_view(), name='image-upload-session'),
+    path('uploads/<int:image_id>/finalize/', ImageUploadFinalizeView.as_view(),
+         name='image-upload-finalize'),
+    path('uploads/files/<path:name>', local_upload_view, name='image-upload-file'),
+    path('files/<path:name>', local_file_view, name='image-file'),
 ]
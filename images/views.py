@@ -1,8 +1,15 @@
+import mimetypes
+import time
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from .serializers import ImageSerializer
-from .services import ImageService
+from .services import ImageService, MAX_IMAGE_SIZE
+from .storage import LocalFileStorage, get_storage
 
 
 class ImageUploadView(APIView):
@@ -20,3 +27,93 @@ class ImageUploadView(APIView):
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ImageUploadSessionView(APIView):
+
+    def post(self, request):
+        try:
+            service = ImageService(user=request.user)
+            image, upload = service.create_upload(
+                request.data.get('filename'), user=request.user)
+            data = ImageSerializer(image).data
+            data['upload'] = upload
+            return Response(data, status=status.HTTP_201_CREATED)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ImageUploadFinalizeView(APIView):
+
+    def post(self, request, image_id):
+        try:
+            service = ImageService(user=request.user)
+            image = service.finalize_upload(image_id, user=request.user)
+            serializer = ImageSerializer(image)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        except ValueError as e:
+            if str(e) == "Image not found":
+                return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@csrf_exempt
+@require_http_methods(['PUT'])
+def local_upload_view(request, name):
+    """
+    Receives a direct upload for LocalFileStorage, the counterpart of a
+    write SAS on Azure. The signature from sign_upload is the credential.
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalFileStorage):
+        raise Http404
+    if not storage.verify(name, request.GET.get('expires'), None,
+                          request.GET.get('sig'), method='PUT'):
+        return HttpResponseForbidden()
+    try:
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return HttpResponse(status=411)
+    if length > MAX_IMAGE_SIZE:
+        return HttpResponse(status=413)
+    # like a create-only SAS, the URL cannot replace a finished upload
+    if storage.stat(name) is not None:
+        return HttpResponse(status=409)
+
+    # streamed to disk, the body is never held in memory
+    storage.upload(name, request)
+    return HttpResponse(status=201)
+
+
+def local_file_view(request, name):
+    """
+    Serves a LocalFileStorage file to holders of a signed URL. No login is
+    needed, the signature is the credential, so image tags can load it.
+    """
+    storage = get_storage()
+    if not isinstance(storage, LocalFileStorage):
+        raise Http404
+    expires = request.GET.get('expires')
+    disposition = request.GET.get('disposition')
+    if not storage.verify(name, expires, disposition, request.GET.get('sig')):
+        return HttpResponseForbidden()
+
+    try:
+        path = storage.path(name)
+    except ValueError:
+        raise Http404
+    if not path.is_file():
+        raise Http404
+
+    if settings.LOCAL_STORAGE_ACCEL_REDIRECT:
+        # the web server sends the file itself
+        response = HttpResponse(content_type=mimetypes.guess_type(name)[0])
+        response['X-Accel-Redirect'] = settings.LOCAL_STORAGE_ACCEL_REDIRECT.rstrip('/') + '/' + name
+    else:
+        # handed to the WSGI server's file wrapper, sendfile where supported
+        response = FileResponse(open(path, 'rb'))
+    if disposition:
+        response['Content-Disposition'] = disposition
+    # the URL stays valid until it expires, browsers may keep the file
+    response['Cache-Control'] = f"private, max-age={max(int(expires) - int(time.time()), 0)}"
+    return response
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mealplans', '0003_remove_mealplanrecipe_meal_type'),
+        ('recipes', '0008_live_row_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='mealplan',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['created_by', '-created_at', '-id'], name='mealplan_live_owner_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='mealplanrecipe',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['meal_plan'], name='mealplanrecipe_live_plan_idx'),
+        ),
+    ]
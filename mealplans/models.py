@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User as AuthUser
 
 
@@ -19,6 +20,10 @@ class MealPlan(models.Model):
     class Meta:
         verbose_name = 'Meal Plan'
         verbose_name_plural = 'Meal Plans'
+        indexes = [
+            models.Index(fields=['created_by', '-created_at', '-id'], condition=Q(is_deleted=False),
+                         name='mealplan_live_owner_idx'),
+        ]
 
 
 class MealPlanRecipe(models.Model):
@@ -39,3 +44,7 @@ class MealPlanRecipe(models.Model):
     class Meta:
         verbose_name = 'Meal Plan Recipe'
         verbose_name_plural = 'Meal Plan Recipes'
+        indexes = [
+            models.Index(fields=['meal_plan'], condition=Q(is_deleted=False),
+                         name='mealplanrecipe_live_plan_idx'),
+        ]
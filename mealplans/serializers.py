@@ -19,9 +19,20 @@ class MealPlanRecipeSerializer(serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     recipe_id = serializers.IntegerField(write_only=True)
     image_url = serializers.CharField(read_only=True)
+    thumbnail_url = serializers.CharField(read_only=True, allow_null=True)
+    srcset = serializers.CharField(read_only=True, allow_null=True)
 
     class Meta:
         model = MealPlanRecipe
         fields = '__all__'
         read_only_fields = ['id', 'created_at',
-                            'created_by', 'is_deleted', 'image_url']
+                            'created_by', 'is_deleted', 'image_url',
+                            'thumbnail_url', 'srcset']
+
+
+class ShoppingListItemSerializer(serializers.Serializer):
+    ingredient_id = serializers.IntegerField()
+    name = serializers.CharField()
+    unit = serializers.CharField()
+    total_quantity = serializers.FloatField()
+    recipe_count = serializers.IntegerField()
@@ -1,6 +1,9 @@
 from .models import MealPlan, MealPlanRecipe
-from recipes.services import RecipeService
-from images.services import ImageService
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from recipes.models import Recipe, RecipeIngredient
+from recipebuilder.conditional import get_validators
+from images.services import ImageService, set_image_urls
 
 
 class MealPlanService:
@@ -9,18 +12,27 @@ class MealPlanService:
             raise ValueError("User must be provided")
         self.user = user
 
-    def get_meal_plan(self):
+    def get_meal_plan(self, paginator=None):
         """
-        Retrieves the meal plans for the user.
+        Retrieves the meal plans for the user, one page at a time when a
+        paginator is given.
         """
         meal_plans = MealPlan.objects.filter(
-            created_by=self.user, is_deleted=False).order_by('-created_at')
+            created_by=self.user, is_deleted=False).select_related('created_by').order_by('-created_at')
+        if paginator is not None:
+            meal_plans = paginator.paginate(meal_plans)
 
         if not meal_plans:
             raise ValueError("No meal plans found for the user.")
 
         return meal_plans
 
+    def get_meal_plan_validators(self):
+        """
+        Returns the last update time and count of the user's meal plans.
+        """
+        return get_validators(MealPlan.objects.filter(created_by=self.user))
+
     def create_meal_plan(self, title, start_date, end_date):
         """
         Creates a new meal plan for the user.
@@ -55,13 +67,21 @@ class MealPlanService:
         Retrieves a meal plan by its ID.
         """
         try:
-            meal_plan = MealPlan.objects.get(
+            meal_plan = MealPlan.objects.select_related('created_by').get(
                 id=meal_plan_id, is_deleted=False, created_by=self.user)
             return meal_plan
         except MealPlan.DoesNotExist:
             raise ValueError(
                 "Meal plan not found or does not belong to the user.")
 
+    def get_meal_plan_by_id_validators(self, meal_plan_id):
+        """
+        Returns the last update time of a meal plan, with a count of zero
+        when it does not exist, was deleted or does not belong to the user.
+        """
+        return get_validators(MealPlan.objects.filter(
+            id=meal_plan_id, created_by=self.user))
+
     def update_meal_plan(self, meal_plan_id, title, start_date, end_date):
         """
         Updates an existing meal plan.
@@ -81,6 +101,26 @@ class MealPlanService:
         except ValueError as e:
             raise ValueError(f"Failed to update meal plan: {str(e)}")
 
+    def get_shopping_list(self, meal_plan_id):
+        """
+        Totals the quantity of each ingredient needed for all the recipes in
+        a meal plan, grouped in the database.
+        """
+        meal_plan = self.get_meal_plan_by_id(meal_plan_id)
+
+        # a recipe planned more than once is counted once per entry
+        return RecipeIngredient.objects.filter(
+            recipe__meal_plan_recipes__meal_plan=meal_plan,
+            recipe__meal_plan_recipes__is_deleted=False,
+            recipe__is_deleted=False,
+            is_deleted=False
+        ).values(
+            'ingredient_id', name=F('ingredient__name'), unit=F('ingredient__unit')
+        ).annotate(
+            total_quantity=Sum('quantity'),
+            recipe_count=Count('recipe_id', distinct=True)
+        ).order_by('name', 'unit')
+
 
 class MealPlanRecipeService:
     def __init__(self, user=None):
@@ -90,47 +130,63 @@ class MealPlanRecipeService:
 
     def add_recipe_to_meal_plan(self, meal_plan_id, list):
         """
-        Adds a recipe to a meal plan.
+        Adds a batch of recipes to a meal plan in a single transaction.
+        Recipes already in the meal plan are returned as they are.
         """
         if not meal_plan_id or not list:
             raise ValueError("Meal plan ID and recipe list are required.")
 
-        result = []
-        meal_plan = MealPlanService(
-            self.user).get_meal_plan_by_id(meal_plan_id)
-
+        recipe_ids = []
         for item in list:
             recipe_id = item.get('recipe_id')
 
             if not recipe_id:
                 raise ValueError(
                     "Recipe ID and meal type are required for each item.")
+            recipe_ids.append(recipe_id)
 
-            recipe = RecipeService().get_recipe_by_id(recipe_id)
-
-            # Check if the recipe already exists in the meal plan
-            existing_item = MealPlanRecipe.objects.filter(
-                meal_plan=meal_plan,
-                recipe=recipe,
+        meal_plan = MealPlanService(
+            self.user).get_meal_plan_by_id(meal_plan_id)
 
-                is_deleted=False
-            ).first()
+        recipes = Recipe.objects.filter(
+            is_deleted=False).select_related('created_by').in_bulk(recipe_ids)
+        missing_ids = sorted(set(recipe_ids) - recipes.keys())
+        if missing_ids:
+            raise ValueError(
+                f"Recipes not found: {', '.join(str(id) for id in missing_ids)}")
 
-            if existing_item:
-                existing_item.is_deleted = False
-                existing_item.save()
-                result.append(existing_item)
-            else:
-                # Create a new MealPlanRecipe entry if it doesn't exist
-                meal_plan_recipe = MealPlanRecipe.objects.create(
+        with transaction.atomic():
+            # Check which recipes already exist in the meal plan
+            entries = {
+                entry.recipe_id: entry for entry in MealPlanRecipe.objects.filter(
                     meal_plan=meal_plan,
-                    recipe=recipe,
-
+                    recipe_id__in=recipes.keys(),
+                    is_deleted=False
+                ).select_related('created_by')
+            }
+
+            # Create the MealPlanRecipe entries that don't exist yet
+            new_entries = [
+                MealPlanRecipe(
+                    meal_plan=meal_plan,
+                    recipe=recipes[recipe_id],
                     created_by=self.user
                 )
-                result.append(meal_plan_recipe)
-
-        return result
+                for recipe_id in dict.fromkeys(recipe_ids) if recipe_id not in entries
+            ]
+            MealPlanRecipe.objects.bulk_create(new_entries)
+
+        entries.update((entry.recipe_id, entry) for entry in new_entries)
+        image_urls = ImageService().get_image_url_sets(
+            recipe.image_id for recipe in recipes.values())
+        for recipe_id, entry in entries.items():
+            entry.meal_plan = meal_plan
+            entry.recipe = recipes[recipe_id]
+            urls = image_urls.get(entry.recipe.image_id)
+            set_image_urls(entry.recipe, urls)
+            set_image_urls(entry, urls)
+
+        return [entries[recipe_id] for recipe_id in recipe_ids]
 
     def get_meal_plan_recipes(self, meal_plan_id):
         """
@@ -141,15 +197,13 @@ class MealPlanRecipeService:
 
         meal_plan_recipes = MealPlanRecipe.objects.filter(
             meal_plan=meal_plan, is_deleted=False
-        ).select_related('recipe')
+        ).select_related('created_by', 'recipe__created_by', 'meal_plan__created_by').defer(
+            'recipe__search_vector')
 
+        image_urls = ImageService().get_image_url_sets(
+            recipe.recipe.image_id for recipe in meal_plan_recipes)
         for recipe in meal_plan_recipes:
-            image_id = recipe.recipe.image_id if recipe.recipe else None
-            image_service = ImageService(recipe.created_by)
-            image_url = image_service.get_image_url(
-                image_id) if image_id else None
-
-            recipe.image_url = image_url
+            set_image_urls(recipe, image_urls.get(recipe.recipe.image_id))
 
         if not meal_plan_recipes:
             raise ValueError("No recipes found for the specified meal plan.")
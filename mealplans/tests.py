@@ -1,3 +1,148 @@
-from django.test import TestCase
+from datetime import datetime, timedelta, timezone
+from recipebuilder.testing import AuthenticatedAPITestCase, QueryCountAssertions
+from recipes.models import RecipeIngredient
+from .models import MealPlan, MealPlanRecipe
 
-# Create your tests here.
+
+class MealPlanQueryCountTests(QueryCountAssertions, AuthenticatedAPITestCase):
+
+    def make_meal_plan(self):
+        return MealPlan.objects.create(
+            title='Week', start_date='2025-01-06', end_date='2025-01-12', created_by=self.user)
+
+    def test_meal_plan_list(self):
+        # validators, then the page of meal plans
+        self.assertConstantQueries(
+            2, '/mealplans/meal-plans/', self.make_meal_plan)
+
+    def test_meal_plan_detail(self):
+        meal_plan = self.make_meal_plan()
+
+        def seed():
+            MealPlanRecipe.objects.create(
+                meal_plan=meal_plan, recipe=self.data.recipe(), created_by=self.user)
+
+        # validators, then the meal plan with its creator
+        self.assertConstantQueries(
+            2, f'/mealplans/meal-plans/{meal_plan.id}/', seed)
+
+    def test_meal_plan_recipe_list(self):
+        meal_plan = self.make_meal_plan()
+
+        def seed():
+            MealPlanRecipe.objects.create(
+                meal_plan=meal_plan, recipe=self.data.recipe(), created_by=self.user)
+
+        # the meal plan, its rows joined to recipes and creators, then images
+        self.assertConstantQueries(
+            3, f'/mealplans/meal-plans/{meal_plan.id}/recipes/', seed)
+
+
+class ShoppingListTests(AuthenticatedAPITestCase):
+
+    def test_totals_quantities_across_recipes(self):
+        meal_plan = MealPlan.objects.create(
+            title='Week', start_date='2025-01-06', end_date='2025-01-12', created_by=self.user)
+        flour = self.data.ingredient()
+        pancakes, bread, removed = self.data.recipe(), self.data.recipe(), self.data.recipe()
+        for recipe, quantity in ((pancakes, 200), (bread, 500), (removed, 1000)):
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=flour, quantity=quantity, created_by=self.user)
+        eggs = self.data.recipe_ingredient(pancakes)
+        for recipe in (pancakes, bread, removed):
+            MealPlanRecipe.objects.create(
+                meal_plan=meal_plan, recipe=recipe, created_by=self.user)
+        MealPlanRecipe.objects.filter(recipe=removed).update(is_deleted=True)
+
+        # the meal plan lookup and the grouped totals
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                f'/mealplans/meal-plans/{meal_plan.id}/shopping-list/')
+        totals = {item['ingredient_id']: item for item in response.json()}
+        self.assertEqual(totals[flour.id]['total_quantity'], 700)
+        self.assertEqual(totals[flour.id]['recipe_count'], 2)
+        self.assertEqual(totals[eggs.ingredient_id]['total_quantity'], 1)
+        self.assertEqual(len(totals), 2)
+
+
+class AddRecipesToMealPlanTests(AuthenticatedAPITestCase):
+
+    def test_adds_batch_with_fixed_queries(self):
+        meal_plan = MealPlan.objects.create(
+            title='Month', start_date='2025-01-01', end_date='2025-01-31', created_by=self.user)
+        planned = self.data.recipe()
+        MealPlanRecipe.objects.create(
+            meal_plan=meal_plan, recipe=planned, created_by=self.user)
+        recipes = [self.data.recipe() for _ in range(30)]
+        payload = [{'recipe_id': recipe.id}
+                   for recipe in [planned, *recipes, recipes[0]]]
+
+        # meal plan, recipes, existing entries, images, and the insert
+        # inside its savepoint
+        with self.assertNumQueries(7):
+            response = self.client.post(
+                f'/mealplans/meal-plans/{meal_plan.id}/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            [item['recipe']['id'] for item in response.json()], [item['recipe_id'] for item in payload])
+        self.assertEqual(meal_plan.meal_plan_recipes.count(), 31)
+
+    def test_missing_recipe_adds_nothing(self):
+        meal_plan = MealPlan.objects.create(
+            title='Week', start_date='2025-01-06', end_date='2025-01-12', created_by=self.user)
+        payload = [{'recipe_id': self.data.recipe().id}, {'recipe_id': 999}]
+        response = self.client.post(
+            f'/mealplans/meal-plans/{meal_plan.id}/recipes/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], "Recipes not found: 999")
+        self.assertFalse(meal_plan.meal_plan_recipes.exists())
+
+
+class ConditionalGetTests(AuthenticatedAPITestCase):
+
+    def test_meal_plan_not_modified_until_updated(self):
+        meal_plan = MealPlan.objects.create(
+            title='Week', start_date='2025-01-06', end_date='2025-01-12', created_by=self.user)
+        url = f'/mealplans/meal-plans/{meal_plan.id}/'
+        response = self.client.get(url)
+        etag, last_modified = response['ETag'], response['Last-Modified']
+
+        # only the validators query runs, nothing is serialized
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.put(
+            url, {'title': 'Busy week', 'start_date': '2025-01-06', 'end_date': '2025-01-12'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_list_etag_changes_when_a_row_is_deleted(self):
+        first, second = (MealPlan.objects.create(
+            title=title, start_date='2025-01-06', end_date='2025-01-12', created_by=self.user)
+            for title in ('One', 'Two'))
+        etag = self.client.get('/mealplans/meal-plans/')['ETag']
+        self.client.delete(f'/mealplans/meal-plans/{first.id}/')
+        response = self.client.get(
+            '/mealplans/meal-plans/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([plan['id'] for plan in response.json()], [second.id])
+
+    def test_deleting_the_newest_row_moves_last_modified_forward(self):
+        older, newest = (MealPlan.objects.create(
+            title=title, start_date='2025-01-06', end_date='2025-01-12', created_by=self.user)
+            for title in ('One', 'Two'))
+        MealPlan.objects.filter(id=older.id).update(
+            updated_at=datetime.now(timezone.utc) - timedelta(hours=2))
+        MealPlan.objects.filter(id=newest.id).update(
+            updated_at=datetime.now(timezone.utc) - timedelta(hours=1))
+        last_modified = self.client.get('/mealplans/meal-plans/')['Last-Modified']
+
+        self.client.delete(f'/mealplans/meal-plans/{newest.id}/')
+        response = self.client.get(
+            '/mealplans/meal-plans/', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([plan['id'] for plan in response.json()], [older.id])
@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import MealPlanView, MealPlanDetailView, MealPlanRecipeView
+from .views import MealPlanView, MealPlanDetailView, MealPlanRecipeView, MealPlanShoppingListView
 
 urlpatterns = [
     path('meal-plans/', MealPlanView.as_view(), name='meal-plan-list'),
@@ -7,4 +7,6 @@ urlpatterns = [
          MealPlanDetailView.as_view(), name='meal-plan-detail'),
     path('meal-plans/<int:meal_plan_id>/recipes/',
          MealPlanRecipeView.as_view(), name='meal-plan-recipe-list'),
+    path('meal-plans/<int:meal_plan_id>/shopping-list/',
+         MealPlanShoppingListView.as_view(), name='meal-plan-shopping-list'),
 ]
@@ -1,21 +1,32 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import MealPlanSerializer, MealPlanRecipeSerializer
+from .serializers import MealPlanSerializer, MealPlanRecipeSerializer, ShoppingListItemSerializer
 from .services import MealPlanService, MealPlanRecipeService
+from recipebuilder.conditional import conditional_get
+from recipebuilder.pagination import KeysetPaginator
 
 
 class MealPlanView(APIView):
 
+    def get_validators(self, request):
+        return MealPlanService(user=request.user).get_meal_plan_validators()
+
+    @conditional_get()
     def get(self, request):
         """
-        Retrieves the meal plans for the authenticated user.
+        Retrieves a page of meal plans for the authenticated user. The cursor
+        for the next page is returned in the X-Next-Cursor header.
         """
         try:
+            paginator = KeysetPaginator.from_request(request)
             service = MealPlanService(user=request.user)
-            meal_plans = service.get_meal_plan()
+            meal_plans = service.get_meal_plan(paginator)
             serializer = MealPlanSerializer(meal_plans, many=True)
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            response = Response(serializer.data, status=status.HTTP_200_OK)
+            if paginator.next_cursor:
+                response['X-Next-Cursor'] = paginator.next_cursor
+            return response
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -40,6 +51,10 @@ class MealPlanView(APIView):
 
 class MealPlanDetailView(APIView):
 
+    def get_validators(self, request, meal_plan_id):
+        return MealPlanService(user=request.user).get_meal_plan_by_id_validators(meal_plan_id)
+
+    @conditional_get()
     def get(self, request, meal_plan_id):
         """
         Retrieves a specific meal plan by its ID.
@@ -132,3 +147,18 @@ class MealPlanRecipeView(APIView):
                 return Response({"error": "Failed to delete meal plan recipe"}, status=status.HTTP_400_BAD_REQUEST)
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class MealPlanShoppingListView(APIView):
+
+    def get(self, request, meal_plan_id):
+        """
+        Retrieves the total quantity of each ingredient needed for a meal plan.
+        """
+        try:
+            service = MealPlanService(user=request.user)
+            shopping_list = service.get_shopping_list(meal_plan_id)
+            serializer = ShoppingListItemSerializer(shopping_list, many=True)
+            return Response(serializer.data, status=status.HTTP_200_OK)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,68 @@
+import hashlib
+from functools import wraps
+from django.db.models import Count, Max, Q
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from images.storage import sas_url_cache
+
+
+def get_validators(queryset, last_modified=Max('updated_at')):
+    """
+    Returns the newest modification time and the live row count of a
+    queryset with a single aggregate query. The queryset includes
+    soft-deleted rows: deleting one bumps its updated_at, so removing the
+    newest row moves Last-Modified forward instead of back to the newest
+    row that is left.
+    """
+    result = queryset.aggregate(
+        last_modified=last_modified, count=Count('id', filter=Q(is_deleted=False)))
+    return result['last_modified'], result['count']
+
+
+def last_modified_timestamp(last_modified, signed_urls=False):
+    """
+    Returns the Last-Modified timestamp of a response built from rows last
+    changed at `last_modified`. Signed image URLs are re-signed when the
+    signing window turns over, so such a response is never older than the
+    start of the current window.
+    """
+    timestamp = int(last_modified.timestamp())
+    if signed_urls:
+        window_start = sas_url_cache.current_window() * sas_url_cache.window_seconds
+        timestamp = max(timestamp, window_start)
+    return timestamp
+
+
+def conditional_get(signed_urls=False):
+    """
+    Answers conditional GETs before the view body runs. The view class
+    provides get_validators(request, *args, **kwargs), returning the newest
+    updated_at and the row count of the rows the response is built from,
+    and a 304 is returned when the client's ETag or Last-Modified still
+    matches. Views whose responses embed signed image URLs pass
+    signed_urls=True so both validators also change with the signing window.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            last_modified, count = view.get_validators(request, *args, **kwargs)
+            if not count:
+                return view_method(view, request, *args, **kwargs)
+
+            etag_source = f"{request.get_full_path()}|{request.user.pk}|{last_modified.isoformat()}|{count}"
+            if signed_urls:
+                etag_source += f"|{sas_url_cache.current_window()}"
+            etag = quote_etag(hashlib.md5(etag_source.encode()).hexdigest())
+            timestamp = last_modified_timestamp(last_modified, signed_urls)
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view_method(view, request, *args, **kwargs)
+            if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(timestamp)
+            return response
+        return wrapper
+    return decorator
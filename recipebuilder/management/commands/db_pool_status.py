@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports how the database connections are configured and how many "
+        "server connections are in use."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help="Database alias to report on.")
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        settings_dict = connection.settings_dict
+        pool_options = settings_dict.get('OPTIONS', {}).get('pool')
+
+        self.stdout.write(f"Database: {options['database']} ({connection.vendor})")
+        if pool_options:
+            if pool_options is True:
+                pool_options = {}
+            # psycopg_pool's defaults, a pool without max_size is capped at min_size
+            min_size = pool_options.get('min_size', 4)
+            max_size = pool_options.get('max_size') or min_size
+            self.stdout.write(
+                f"Pool: min_size={min_size} max_size={max_size} "
+                f"timeout={pool_options.get('timeout', 30)}s")
+        else:
+            self.stdout.write(
+                f"Pool: disabled, CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}s "
+                f"CONN_HEALTH_CHECKS={settings_dict['CONN_HEALTH_CHECKS']}")
+
+        # each worker process holds its own pool, so utilisation is read
+        # from the server, which sees the connections of every worker
+        if connection.vendor != 'postgresql':
+            self.stdout.write("Server connection usage is only available on PostgreSQL.")
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute("SHOW max_connections")
+            max_connections = int(cursor.fetchone()[0])
+            cursor.execute(
+                "SELECT coalesce(state, 'unknown'), count(*) FROM pg_stat_activity "
+                "WHERE datname = current_database() AND usename = current_user "
+                "GROUP BY 1 ORDER BY 1")
+            states = cursor.fetchall()
+
+        total = sum(count for _, count in states)
+        self.stdout.write(
+            f"Server connections: {total} of max_connections={max_connections} "
+            f"({total / max_connections:.0%})")
+        for state, count in states:
+            self.stdout.write(f"  {state}: {count}")
+
+        if pool_options:
+            self.stdout.write(
+                f"Pool capacity per worker: {max_size} "
+                f"({max_connections // max_size} workers fit within max_connections)")
@@ -0,0 +1,182 @@
+import hmac
+import threading
+from bisect import bisect_left
+from contextlib import ExitStack
+from contextvars import ContextVar
+from time import perf_counter
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus model: per-bucket counts of
+    observations less than or equal to each bound, plus their count and sum.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), self.counts):
+            cumulative += count
+            yield bound, cumulative
+
+
+class MetricsRegistry:
+    """
+    In-process histograms per metric and (endpoint, method). Each worker
+    process keeps its own, so every worker has to be scraped.
+    """
+
+    metrics = {
+        'request_duration_seconds': ('Wall time of the request', SECONDS_BUCKETS),
+        'request_db_queries': ('Database queries run by the request', QUERY_BUCKETS),
+        'request_db_duration_seconds': ('Time spent in database queries', SECONDS_BUCKETS),
+        'request_azure_duration_seconds': ('Time spent in Azure Storage calls', SECONDS_BUCKETS),
+    }
+
+    def __init__(self, prefix='recipebuilder'):
+        self.prefix = prefix
+        self._histograms = {name: {} for name in self.metrics}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, method, duration, request_metrics):
+        values = {
+            'request_duration_seconds': duration,
+            'request_db_queries': request_metrics.db_queries,
+            'request_db_duration_seconds': request_metrics.db_time,
+            'request_azure_duration_seconds': request_metrics.azure_time,
+        }
+        with self._lock:
+            for name, value in values.items():
+                histogram = self._histograms[name].get((endpoint, method))
+                if histogram is None:
+                    histogram = self._histograms[name][(endpoint, method)] = Histogram(
+                        self.metrics[name][1])
+                histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            for histograms in self._histograms.values():
+                histograms.clear()
+
+    def render(self):
+        """
+        Returns the histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for name, (help, _) in self.metrics.items():
+                metric = f"{self.prefix}_{name}"
+                lines.append(f"# HELP {metric} {help}")
+                lines.append(f"# TYPE {metric} histogram")
+                for (endpoint, method), histogram in sorted(self._histograms[name].items()):
+                    labels = f'endpoint="{endpoint}",method="{method}"'
+                    for bound, count in histogram.samples():
+                        lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+                    lines.append(f"{metric}_sum{{{labels}}} {histogram.sum}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetrics:
+    """
+    Totals for the request being handled. Installed as a database execute
+    wrapper it counts and times every query.
+    """
+
+    def __init__(self):
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.azure_calls = 0
+        self.azure_time = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_queries += 1
+            self.db_time += perf_counter() - start
+
+    def server_timing(self, duration):
+        return (
+            f'app;dur={duration * 1000:.1f}, '
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries", '
+            f'azure;dur={self.azure_time * 1000:.1f};desc="{self.azure_calls} calls"'
+        )
+
+
+def record_azure_call(seconds):
+    """
+    Adds an Azure Storage call to the metrics of the current request, if
+    there is one.
+    """
+    request_metrics = _current.get()
+    if request_metrics is not None:
+        request_metrics.azure_calls += 1
+        request_metrics.azure_time += seconds
+
+
+class RequestMetricsMiddleware:
+    """
+    Records wall time, query count, query time and Azure time of every
+    request under its URL name and reports them in a Server-Timing header.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = RequestMetrics()
+        token = _current.set(request_metrics)
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(request_metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        duration = perf_counter() - start
+
+        match = request.resolver_match
+        endpoint = match.url_name if match and match.url_name else 'unresolved'
+        if endpoint != 'metrics':
+            registry.observe(endpoint, request.method, duration, request_metrics)
+        response['Server-Timing'] = request_metrics.server_timing(duration)
+        return response
+
+
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint. It needs `Authorization: Bearer
+    <METRICS_TOKEN>` and is not served when no token is configured, except
+    in DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if not token and not settings.DEBUG:
+        raise Http404
+    if token and not hmac.compare_digest(
+            request.headers.get('Authorization', ''), f"Bearer {token}"):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,113 @@
+import base64
+from datetime import datetime
+from django.conf import settings
+from django.db.models import Q
+
+
+class KeysetPaginator:
+    """
+    Cursor pagination over (created_at, id), newest first. The cursor holds
+    the position of the last row of the previous page, so every page is a
+    range scan from that position however deep the client has paged.
+    """
+
+    def __init__(self, cursor=None, page_size=None):
+        self.page_size = self.parse_page_size(page_size)
+        self.position = self.decode_cursor(cursor) if cursor else None
+        self.next_cursor = None
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(
+            cursor=request.query_params.get('cursor'),
+            page_size=request.query_params.get('page_size')
+        )
+
+    def paginate(self, queryset):
+        queryset = queryset.order_by('-created_at', '-id')
+        if self.position:
+            created_at, last_id = self.position
+            queryset = queryset.filter(
+                Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=last_id))
+
+        # fetch one extra row to know whether there is a next page
+        page = list(queryset[:self.page_size + 1])
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            last = page[-1]
+            if isinstance(last, dict):
+                # values() rows
+                self.next_cursor = self.encode_cursor(
+                    last['created_at'], last['id'])
+            else:
+                self.next_cursor = self.encode_cursor(
+                    last.created_at, last.id)
+        return page
+
+    @staticmethod
+    def parse_page_size(page_size):
+        if page_size in (None, ''):
+            return settings.PAGINATION_PAGE_SIZE
+        try:
+            page_size = int(page_size)
+        except (TypeError, ValueError):
+            raise ValueError("page_size must be a positive integer")
+        if page_size < 1:
+            raise ValueError("page_size must be a positive integer")
+        return min(page_size, settings.PAGINATION_MAX_PAGE_SIZE)
+
+    @staticmethod
+    def encode_cursor(created_at, last_id):
+        position = f"{created_at.isoformat()}|{last_id}"
+        return base64.urlsafe_b64encode(position.encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            position = base64.urlsafe_b64decode(cursor.encode()).decode()
+            created_at, last_id = position.split('|')
+            return datetime.fromisoformat(created_at), int(last_id)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+
+
+class OffsetPaginator:
+    """
+    Pagination by position for orderings that have no stable keyset, such
+    as search relevance. The cursor is opaque to clients, like the
+    KeysetPaginator's, but holds the offset of the next page.
+    """
+
+    def __init__(self, cursor=None, page_size=None):
+        self.page_size = KeysetPaginator.parse_page_size(page_size)
+        self.offset = self.decode_cursor(cursor) if cursor else 0
+        self.next_cursor = None
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(
+            cursor=request.query_params.get('cursor'),
+            page_size=request.query_params.get('page_size')
+        )
+
+    def paginate(self, queryset):
+        page = list(queryset[self.offset:self.offset + self.page_size + 1])
+        if len(page) > self.page_size:
+            page = page[:self.page_size]
+            self.next_cursor = self.encode_cursor(self.offset + self.page_size)
+        return page
+
+    @staticmethod
+    def encode_cursor(offset):
+        return base64.urlsafe_b64encode(f"offset|{offset}".encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            kind, offset = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+            offset = int(offset)
+        except ValueError:
+            raise ValueError("Invalid cursor")
+        if kind != 'offset' or offset < 0:
+            raise ValueError("Invalid cursor")
+        return offset
@@ -28,6 +28,9 @@ ALLOWED_HOSTS = env('ALLOWED_HOSTS').split(',')
 
 CORS_ALLOWED_ORIGINS = env('CORS_ALLOWED_ORIGINS').split(',')
 
+# let browser clients read the meal plan pagination cursor
+CORS_EXPOSE_HEADERS = ['X-Next-Cursor']
+
 
 # Application definition
 INSTALLED_APPS = [
@@ -37,9 +40,11 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework_simplejwt',
     'corsheaders',
+    'recipebuilder',
     'users',
     'recipes',
     'mealplans',
@@ -58,6 +63,48 @@ REST_FRAMEWORK = {
     ),
 }
 
+# cursor pagination for list endpoints
+PAGINATION_PAGE_SIZE = env.int('PAGINATION_PAGE_SIZE', default=50)
+PAGINATION_MAX_PAGE_SIZE = env.int('PAGINATION_MAX_PAGE_SIZE', default=200)
+
+# Render the full recipe, ingredient and recipe ingredient lists from
+# values() rows instead of model instances and ModelSerializer. The JSON is
+# the same either way, see `manage.py benchmark_list_serializers`.
+FAST_LIST_SERIALIZATION = env.bool('FAST_LIST_SERIALIZATION', default=False)
+
+# PostgreSQL text search configuration used for recipe search
+SEARCH_CONFIG = env.str('SEARCH_CONFIG', default='english')
+AUTOCOMPLETE_LIMIT = env.int('AUTOCOMPLETE_LIMIT', default=10)
+AUTOCOMPLETE_MAX_LIMIT = env.int('AUTOCOMPLETE_MAX_LIMIT', default=50)
+
+# Image storage, images.storage.AzureBlobStorage or
+# images.storage.LocalFileStorage. Local files are served by the signed
+# /images/files/ view, or by the web server when LOCAL_STORAGE_ACCEL_REDIRECT
+# names the internal location (nginx X-Accel-Redirect) they are exposed at.
+IMAGE_STORAGE_BACKEND = env.str(
+    'IMAGE_STORAGE_BACKEND', default='images.storage.AzureBlobStorage')
+LOCAL_STORAGE_ROOT = env.str('LOCAL_STORAGE_ROOT', default=str(BASE_DIR / 'storage'))
+LOCAL_STORAGE_BASE_URL = env.str('LOCAL_STORAGE_BASE_URL', default='')
+LOCAL_STORAGE_ACCEL_REDIRECT = env.str('LOCAL_STORAGE_ACCEL_REDIRECT', default='')
+# lifetime of the write URLs handed out for direct uploads
+IMAGE_UPLOAD_URL_MINUTES = env.int('IMAGE_UPLOAD_URL_MINUTES', default=10)
+
+# Resized copies rendered for every uploaded image and offered as
+# thumbnail_url and srcset, on IMAGE_VARIANT_WORKERS background threads
+# (0 renders them inline after the upload commits)
+IMAGE_VARIANT_WIDTHS = env.list('IMAGE_VARIANT_WIDTHS', cast=int, default=[160, 480, 960])
+IMAGE_VARIANT_FORMAT = env.str('IMAGE_VARIANT_FORMAT', default='webp')
+IMAGE_VARIANT_QUALITY = env.int('IMAGE_VARIANT_QUALITY', default=80)
+IMAGE_VARIANT_WORKERS = env.int('IMAGE_VARIANT_WORKERS', default=2)
+
+# unreferenced images younger than this are kept by delete_orphan_images,
+# they may still be waiting for the recipe or ingredient they were uploaded for
+IMAGE_GC_GRACE_HOURS = env.int('IMAGE_GC_GRACE_HOURS', default=24)
+
+# Bearer token for the Prometheus endpoint at /metrics/, which is only
+# served without one in DEBUG
+METRICS_TOKEN = env.str('METRICS_TOKEN', default='')
+
 # JWT configuration
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=30),  # Token expiry time
@@ -67,6 +114,8 @@ SIMPLE_JWT = {
 
 
 MIDDLEWARE = [
+    # first, so its timings cover the rest of the stack
+    'recipebuilder.metrics.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -101,17 +150,53 @@ WSGI_APPLICATION = 'recipebuilder.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': env('DB_NAME'),
-        'USER': env('DB_USER'),
-        'PASSWORD': env('DB_PASSWORD'),
-        'HOST': env('DB_HOST'),
-        'PORT': env('DB_PORT'),
+if env('DATABASE_URL', default=None):
+    DATABASES = {
+        'default': dj_database_url.parse(env('DATABASE_URL'))
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': env('DB_NAME'),
+            'USER': env('DB_USER'),
+            'PASSWORD': env('DB_PASSWORD'),
+            'HOST': env('DB_HOST'),
+            'PORT': env('DB_PORT'),
+
+        }
+    }
 
+# keep connections open between requests and check them before reuse
+DATABASES['default']['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=60)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = env.bool(
+    'DB_CONN_HEALTH_CHECKS', default=True)
+
+# psycopg 3 connection pool (pip install "psycopg[binary,pool]"), it takes
+# over from persistent connections when enabled
+if env.bool('DB_POOL', default=False):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+        'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+        'timeout': env.float('DB_POOL_TIMEOUT', default=10.0),
     }
+
+
+# Cache, e.g. redis://host:6379/0. Catalog responses are cached for
+# CATALOG_CACHE_TIMEOUT seconds unless a write invalidates them first, which
+# only reaches every worker and instance through a shared backend. Nothing
+# is cached by default, and per-process or per-host backends (locmemcache://,
+# filecache://) only enable the catalog cache in DEBUG.
+CACHES = {
+    'default': env.cache_url('CACHE_URL', default='dummycache://')
 }
+CATALOG_CACHE_ENABLED = (
+    CACHES['default']['BACKEND'] != 'django.core.cache.backends.dummy.DummyCache'
+    and (DEBUG or CACHES['default']['BACKEND'] not in (
+        'django.core.cache.backends.locmem.LocMemCache',
+        'django.core.cache.backends.filebased.FileBasedCache')))
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', default=300)
 
 
 # Password validation
@@ -0,0 +1,105 @@
+import os
+from unittest import mock
+from django.contrib.auth.models import User as AuthUser
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from images.models import Image
+from recipes.models import Recipe, Ingredient, RecipeIngredient
+
+# offline storage settings, signing a URL never touches the network
+AZURE_TEST_ENV = {
+    'AZURE_BLOB_CONNECTION_STRING': 'DefaultEndpointsProtocol=https;AccountName=testaccount;AccountKey=dGVzdGtleQ==;EndpointSuffix=core.windows.net',
+    'AZURE_STORAGE_CONTAINER_NAME': 'images',
+    'AZURE_STORAGE_ACCOUNT_NAME': 'testaccount',
+    'AZURE_STORAGE_KEY': 'dGVzdGtleQ==',
+}
+
+# tests run in one process, where a local memory cache behaves like a
+# shared one
+enable_catalog_cache = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+    CATALOG_CACHE_ENABLED=True)
+
+
+class TestData:
+    """
+    Factories for test rows. Every seeded row gets its own creator and
+    image, so a missing select_related or a per-row lookup shows up as
+    extra queries.
+    """
+
+    def __init__(self):
+        self.seeded = 0
+
+    def owner(self):
+        return AuthUser.objects.create_user(
+            username='owner@example.com', email='owner@example.com')
+
+    def user(self):
+        self.seeded += 1
+        return AuthUser.objects.create_user(username=f'user{self.seeded}')
+
+    def image(self, user):
+        return Image.objects.create(name=f'{user.username}.jpg', extension='jpg', uploaded_by=user)
+
+    def recipe(self):
+        user = self.user()
+        return Recipe.objects.create(
+            title=f'Recipe {self.seeded}', instructions='Mix.', image=self.image(user), created_by=user)
+
+    def ingredient(self):
+        user = self.user()
+        return Ingredient.objects.create(
+            name=f'Ingredient {self.seeded}', unit='g', image=self.image(user), created_by=user)
+
+    def recipe_ingredient(self, recipe, ingredient=None):
+        return RecipeIngredient.objects.create(
+            recipe=recipe, ingredient=ingredient or self.ingredient(), quantity=1,
+            created_by=self.user())
+
+
+class AuthenticatedAPITestCase(APITestCase):
+    """
+    API test case signed in as the owner, with the response cache cleared
+    and the offline storage settings applied for every test.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        azure_env = mock.patch.dict(os.environ, AZURE_TEST_ENV)
+        azure_env.start()
+        self.addCleanup(azure_env.stop)
+        self.data = TestData()
+        self.user = self.data.owner()
+        self.client.force_authenticate(self.user)
+
+
+class QueryCountAssertions:
+    """
+    AuthenticatedAPITestCase mixin asserting that an endpoint runs a fixed
+    number of queries however many rows it returns.
+    """
+
+    def assertConstantQueries(self, expected, url, seed, rows=(2, 10)):
+        """
+        Seeds the rows in two rounds and checks the endpoint runs exactly
+        `expected` queries after each of them, with the response cache
+        cleared so the database path is what gets measured.
+        """
+        seeded = 0
+        for count in rows:
+            for _ in range(count - seeded):
+                seed()
+            seeded = count
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                len(queries), expected,
+                f"{url} ran {len(queries)} queries with {count} rows:\n" +
+                "\n".join(query['sql'] for query in queries.captured_queries))
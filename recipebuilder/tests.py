@@ -0,0 +1,120 @@
+import base64
+from datetime import datetime, timezone
+from unittest import mock
+from django.test import SimpleTestCase
+from recipes.models import Recipe
+from .conditional import last_modified_timestamp
+from .pagination import KeysetPaginator, OffsetPaginator
+from .testing import AuthenticatedAPITestCase
+
+
+def encode(value):
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+class CursorDecodingTests(SimpleTestCase):
+
+    def test_malformed_keyset_cursors_are_rejected(self):
+        for cursor in ('not base64!', encode('no separator'), encode('a|b|c'),
+                       encode('yesterday|1'), encode('2025-01-01T00:00:00+00:00|x'),
+                       OffsetPaginator.encode_cursor(10), 'Zm9v' + '\xff'):
+            with self.subTest(cursor=cursor), self.assertRaisesMessage(ValueError, "Invalid cursor"):
+                KeysetPaginator(cursor=cursor)
+
+    def test_malformed_offset_cursors_are_rejected(self):
+        created_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        for cursor in ('not base64!', encode('offset|-1'), encode('offset|x'), encode('page|3'),
+                       KeysetPaginator.encode_cursor(created_at, 5)):
+            with self.subTest(cursor=cursor), self.assertRaisesMessage(ValueError, "Invalid cursor"):
+                OffsetPaginator(cursor=cursor)
+
+    def test_cursors_round_trip(self):
+        created_at = datetime(2025, 1, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+        self.assertEqual(
+            KeysetPaginator(cursor=KeysetPaginator.encode_cursor(created_at, 42)).position,
+            (created_at, 42))
+        self.assertEqual(OffsetPaginator(cursor=OffsetPaginator.encode_cursor(40)).offset, 40)
+
+    def test_page_size_is_validated_and_capped(self):
+        with self.settings(PAGINATION_MAX_PAGE_SIZE=200):
+            self.assertEqual(KeysetPaginator(page_size='500').page_size, 200)
+        for page_size in ('0', '-3', 'ten'):
+            with self.subTest(page_size=page_size), self.assertRaises(ValueError):
+                KeysetPaginator(page_size=page_size)
+
+
+class PaginationTests(AuthenticatedAPITestCase):
+
+    def make_recipes(self, count, created_at=None):
+        recipes = [Recipe.objects.create(title=f'Recipe {Recipe.objects.count()}',
+                                         instructions='Mix.', created_by=self.user)
+                   for _ in range(count)]
+        if created_at is not None:
+            Recipe.objects.filter(id__in=[recipe.id for recipe in recipes]).update(
+                created_at=created_at)
+        return recipes
+
+    def page_through(self, paginator_class, page_size, queryset):
+        ids, cursor, pages = [], None, 0
+        while True:
+            paginator = paginator_class(cursor=cursor, page_size=page_size)
+            page = paginator.paginate(queryset)
+            ids.extend(recipe.id for recipe in page)
+            pages += 1
+            cursor = paginator.next_cursor
+            if cursor is None:
+                return ids, pages
+
+    def test_full_last_page_has_no_next_cursor(self):
+        self.make_recipes(4)
+        paginator = KeysetPaginator(page_size=4)
+        self.assertEqual(len(paginator.paginate(Recipe.objects.all())), 4)
+        self.assertIsNone(paginator.next_cursor)
+
+    def test_one_row_past_the_page_gives_a_last_page_of_one(self):
+        recipes = self.make_recipes(5)
+        first = KeysetPaginator(page_size=4)
+        self.assertEqual(len(first.paginate(Recipe.objects.all())), 4)
+        second = KeysetPaginator(cursor=first.next_cursor, page_size=4)
+        self.assertEqual([recipe.id for recipe in second.paginate(Recipe.objects.all())],
+                         [recipes[0].id])
+        self.assertIsNone(second.next_cursor)
+
+    def test_rows_sharing_created_at_are_neither_skipped_nor_repeated(self):
+        tied = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        recipes = self.make_recipes(2) + self.make_recipes(5, created_at=tied)
+        ids, pages = self.page_through(KeysetPaginator, 2, Recipe.objects.all())
+        self.assertEqual(pages, 4)
+        self.assertEqual(ids[:2], [recipes[1].id, recipes[0].id])
+        self.assertEqual(ids[2:], sorted((recipe.id for recipe in recipes[2:]), reverse=True))
+
+    def test_values_rows_get_a_cursor(self):
+        self.make_recipes(3)
+        paginator = KeysetPaginator(page_size=2)
+        paginator.paginate(Recipe.objects.values('id', 'created_at'))
+        next_page = KeysetPaginator(cursor=paginator.next_cursor, page_size=2).paginate(
+            Recipe.objects.values('id', 'created_at'))
+        self.assertEqual(len(next_page), 1)
+
+    def test_offset_pages_end_on_the_boundary(self):
+        recipes = self.make_recipes(6)
+        ids, pages = self.page_through(OffsetPaginator, 3, Recipe.objects.order_by('id'))
+        self.assertEqual(ids, [recipe.id for recipe in recipes])
+        self.assertEqual(pages, 2)
+
+    def test_invalid_cursor_is_a_bad_request(self):
+        response = self.client.get('/recipes/recipe/', {'cursor': encode('a|b|c')})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], "Invalid cursor")
+
+
+class LastModifiedTests(SimpleTestCase):
+
+    def test_signed_responses_are_not_older_than_the_signing_window(self):
+        updated_at = datetime(2025, 1, 1, tzinfo=timezone.utc)
+        window_start = int(updated_at.timestamp()) + 3600
+        with mock.patch('images.storage.sas_url_cache.current_window',
+                        return_value=window_start // 300), \
+                mock.patch('images.storage.sas_url_cache.window_seconds', 300):
+            self.assertEqual(last_modified_timestamp(updated_at, signed_urls=True), window_start)
+            self.assertEqual(last_modified_timestamp(updated_at), int(updated_at.timestamp()))
@@ -2,6 +2,7 @@
 from django.contrib import admin
 from django.urls import path
 from django.urls import include
+from .metrics import metrics_view
 
 
 urlpatterns = [
@@ -10,5 +11,6 @@ urlpatterns = [
     path('recipes/', include('recipes.urls')),
     path('mealplans/', include('mealplans.urls')),
     path('images/', include('images.urls')),
+    path('metrics/', metrics_view, name='metrics'),
 
 ]
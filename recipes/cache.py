@@ -0,0 +1,109 @@
+import hashlib
+import time
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+from images.storage import sas_url_cache
+from recipebuilder.conditional import conditional_get, last_modified_timestamp
+
+
+class CatalogCache:
+    """
+    Response cache for one of the global catalogs (recipes or ingredients).
+    Every key carries the catalog's version counter, so bumping the counter
+    on a write makes all of its cached responses unreachable at once.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.version_key = f"catalog:{name}:version"
+
+    def get_version(self):
+        version = cache.get(self.version_key)
+        if version is None:
+            # start from the clock so a counter that was evicted never comes
+            # back at a version that older cached responses still use
+            cache.add(self.version_key, time.time_ns() // 1000, timeout=None)
+            version = cache.get(self.version_key)
+        return version
+
+    def bump(self):
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            self.get_version()
+
+    def make_key(self, request):
+        # responses embed signed image URLs, so they are only shared within
+        # the signing window that produced them
+        path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        return f"catalog:{self.name}:{self.get_version()}:{sas_url_cache.current_window()}:{path}"
+
+
+recipe_catalog = CatalogCache('recipes')
+ingredient_catalog = CatalogCache('ingredients')
+
+
+def cache_catalog_response(catalog):
+    """
+    Caches successful GET responses of a catalog view and answers
+    conditional requests for it. The ETag is derived from the catalog
+    version and signing window, and Last-Modified from the view's
+    get_validators(request, *args, **kwargs) when it has one, stored with
+    the cached response. A request whose If-None-Match matches is answered
+    without touching the database; If-Modified-Since is checked against the
+    cached Last-Modified, or against fresh validators on a cache miss
+    before the view body runs.
+
+    Without CATALOG_CACHE_ENABLED nothing is cached and views with
+    get_validators answer conditional requests through conditional_get.
+    """
+    def decorator(view_method):
+        uncached = conditional_get(signed_urls=True)(view_method)
+
+        @wraps(view_method)
+        def wrapper(view, request, *args, **kwargs):
+            if not settings.CATALOG_CACHE_ENABLED:
+                if hasattr(view, 'get_validators'):
+                    return uncached(view, request, *args, **kwargs)
+                return view_method(view, request, *args, **kwargs)
+
+            key = catalog.make_key(request)
+            etag = f'"{hashlib.md5(key.encode()).hexdigest()}"'
+
+            if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+            if etag in if_none_match or '*' in if_none_match:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+            cached = cache.get(key)
+            if cached is not None:
+                data, last_modified = cached
+            elif hasattr(view, 'get_validators'):
+                newest, count = view.get_validators(request, *args, **kwargs)
+                last_modified = http_date(
+                    last_modified_timestamp(newest, signed_urls=True)) if count else None
+            else:
+                last_modified = None
+
+            response = get_conditional_response(
+                request, etag=etag,
+                last_modified=parse_http_date_safe(last_modified) if last_modified else None)
+            if response is None:
+                if cached is not None:
+                    response = Response(data, status=status.HTTP_200_OK)
+                else:
+                    response = view_method(view, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    cache.set(key, (response.data, last_modified), settings.CATALOG_CACHE_TIMEOUT)
+
+            response['ETag'] = etag
+            if last_modified:
+                response['Last-Modified'] = last_modified
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+from functools import cached_property
+from operator import itemgetter
+from rest_framework import serializers
+from .serializers import RecipeSerializer, IngredientSerializer, RecipeIngredientSerializer
+
+
+def compile_serializer(serializer, prefix='', top_level=True):
+    """
+    Walks a ModelSerializer once and returns the QuerySet.values() columns it
+    reads and a function that turns one values() row into the dict the
+    serializer would render, with the same keys, order and formatting.
+    """
+    model_fields = {
+        field.name for field in serializer.Meta.model._meta.concrete_fields}
+    columns = []
+    getters = []
+
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        column = prefix + field.source
+
+        if isinstance(field, serializers.BaseSerializer):
+            nested_columns, getter = compile_serializer(
+                field, column + '__', top_level=False)
+            columns.extend(nested_columns)
+        elif field.source not in model_fields:
+            # values the services attach to instances, like image_url, are
+            # only set on the top-level rows and render as null when nested
+            getter = itemgetter(field.source) if top_level else (lambda row: None)
+        elif isinstance(field, serializers.DateTimeField):
+            columns.append(column)
+            getter = _datetime_getter(column, field.to_representation)
+        else:
+            columns.append(column)
+            getter = itemgetter(column)
+        getters.append((name, getter))
+
+    id_column = prefix + 'id'
+
+    def build(row):
+        if not top_level and row[id_column] is None:
+            return None
+        return {name: getter(row) for name, getter in getters}
+
+    return columns, build
+
+
+def _datetime_getter(column, to_representation):
+    def getter(row):
+        value = row[column]
+        return None if value is None else to_representation(value)
+    return getter
+
+
+class FastListSerializer:
+    """
+    Read-only list serializer for the hot list endpoints. It builds response
+    dicts straight from values() rows using extractors compiled from the
+    matching ModelSerializer, so the rendered JSON is byte-identical to the
+    ModelSerializer's without running DRF's per-field machinery per row.
+    """
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+
+    @cached_property
+    def compiled(self):
+        return compile_serializer(self.serializer_class())
+
+    @property
+    def columns(self):
+        return self.compiled[0]
+
+    def to_representation(self, rows):
+        build = self.compiled[1]
+        return [build(row) for row in rows]
+
+
+fast_recipe_list = FastListSerializer(RecipeSerializer)
+fast_ingredient_list = FastListSerializer(IngredientSerializer)
+fast_recipe_ingredient_list = FastListSerializer(RecipeIngredientSerializer)
@@ -0,0 +1,247 @@
+import csv
+import io
+import json
+from itertools import groupby
+from django.contrib.auth.models import User as AuthUser
+from django.db import IntegrityError, transaction
+from .cache import recipe_catalog, ingredient_catalog
+from .models import Recipe, Ingredient, RecipeIngredient
+from .services import RecipeService, violated_constraint
+
+CSV_COLUMNS = ['title', 'instructions',
+               'ingredient_name', 'ingredient_unit', 'quantity']
+
+
+class RecipeImportService:
+    """
+    Streams recipes with their ingredients from a JSON Lines or CSV file
+    into the catalog in chunked transactions.
+
+    JSON Lines holds one recipe per line:
+        {"title": ..., "instructions": ..., "ingredients": [{"name": ..., "unit": ..., "quantity": ...}]}
+    CSV holds one ingredient per row with the CSV_COLUMNS header, and the
+    consecutive rows of a recipe share its title and instructions.
+
+    Only the current chunk and the ids of the ingredients seen so far are
+    kept in memory. After each committed chunk `checkpoint` is the number
+    of recipes read, and passing it back as resume_from skips them.
+    """
+
+    # ingredient ids remembered between chunks, bounding memory when a
+    # catalog has an unusually large number of distinct ingredients
+    ingredient_cache_size = 50000
+
+    def __init__(self, user=None, chunk_size=500, progress=None):
+        if user is None or not isinstance(user, AuthUser):
+            raise ValueError("A valid user must be provided")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be a positive integer")
+        self.user = user
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.ingredient_ids = {}
+        self.stats = {
+            'checkpoint': 0,
+            'recipes_created': 0,
+            'recipes_skipped': 0,
+            'ingredients_created': 0,
+            'recipe_ingredients_created': 0,
+        }
+
+    @staticmethod
+    def detect_format(filename):
+        if filename.endswith(('.jsonl', '.ndjson')):
+            return 'jsonl'
+        if filename.endswith('.csv'):
+            return 'csv'
+        raise ValueError("Unknown import format, use a .jsonl or .csv file")
+
+    def import_file(self, file, format, resume_from=0):
+        """
+        Imports a binary file object and returns the stats. On a bad record
+        the chunks before it stay committed and `checkpoint` says where to
+        resume after fixing it.
+        """
+        self.stats['checkpoint'] = resume_from
+        text = io.TextIOWrapper(file, encoding='utf-8', newline='')
+        try:
+            chunk = []
+            for number, record in self.read_records(text, format):
+                if number <= resume_from:
+                    continue
+                chunk.append(record)
+                if len(chunk) == self.chunk_size:
+                    self._write_chunk(chunk, number)
+                    chunk = []
+            if chunk:
+                self._write_chunk(chunk, number)
+        finally:
+            # the caller owns the underlying file
+            text.detach()
+        return self.stats
+
+    def read_records(self, lines, format):
+        if format == 'jsonl':
+            records = self._read_jsonl(lines)
+        elif format == 'csv':
+            records = self._read_csv(lines)
+        else:
+            raise ValueError("format must be jsonl or csv")
+        for number, record in enumerate(records, start=1):
+            yield number, self._clean(number, record)
+
+    def _read_jsonl(self, lines):
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                raise ValueError(f"Line {line_number}: invalid JSON")
+
+    def _read_csv(self, lines):
+        reader = csv.DictReader(lines)
+        missing = set(CSV_COLUMNS) - set(reader.fieldnames or [])
+        if missing:
+            raise ValueError(
+                f"CSV is missing columns: {', '.join(sorted(missing))}")
+        for (title, instructions), rows in groupby(
+                reader, key=lambda row: (row['title'], row['instructions'])):
+            yield {
+                'title': title,
+                'instructions': instructions,
+                'ingredients': [
+                    {'name': row['ingredient_name'], 'unit': row['ingredient_unit'],
+                     'quantity': row['quantity']}
+                    for row in rows if row['ingredient_name']
+                ],
+            }
+
+    def _clean(self, number, record):
+        if not isinstance(record, dict):
+            raise ValueError(f"Record {number}: expected an object")
+        title = self._text(number, record, 'title', max_length=self._max_length(Recipe, 'title'))
+        instructions = self._text(number, record, 'instructions')
+        if not title or not instructions:
+            raise ValueError(
+                f"Record {number}: title and instructions are required")
+
+        items = record.get('ingredients') or []
+        if not isinstance(items, list):
+            raise ValueError(f"Record {number}: ingredients must be a list")
+        ingredients = {}
+        for item in items:
+            if not isinstance(item, dict):
+                raise ValueError(f"Record {number}: each ingredient must be an object")
+            name = self._text(number, item, 'name', 'ingredient name',
+                              self._max_length(Ingredient, 'name'))
+            unit = self._text(number, item, 'unit', 'ingredient unit',
+                              self._max_length(Ingredient, 'unit'))
+            if not name or not unit:
+                raise ValueError(
+                    f"Record {number}: ingredient name and unit are required")
+            try:
+                quantity = float(item.get('quantity'))
+            except (TypeError, ValueError):
+                raise ValueError(
+                    f"Record {number}: invalid quantity for {name}")
+            # an ingredient listed twice keeps its last quantity
+            ingredients[(name, unit)] = quantity
+        return {'title': title, 'instructions': instructions, 'ingredients': ingredients}
+
+    @staticmethod
+    def _text(number, values, key, label=None, max_length=None):
+        value = values.get(key)
+        if value is None:
+            return ''
+        if not isinstance(value, str):
+            raise ValueError(f"Record {number}: {label or key} must be a string")
+        value = value.strip()
+        # checked here, the database would reject the whole chunk with an
+        # error that is not reported per record
+        if max_length is not None and len(value) > max_length:
+            raise ValueError(
+                f"Record {number}: {label or key} is too long (at most {max_length} characters)")
+        return value
+
+    @staticmethod
+    def _max_length(model, field):
+        return model._meta.get_field(field).max_length
+
+    def _write_chunk(self, chunk, checkpoint):
+        titles = {record['title'] for record in chunk}
+        existing = set(Recipe.objects.filter(
+            is_deleted=False, title__in=titles).values_list('title', flat=True))
+
+        records = []
+        for record in chunk:
+            if record['title'] in existing:
+                continue
+            # titles are unique, the first record with a title wins
+            existing.add(record['title'])
+            records.append(record)
+
+        try:
+            with transaction.atomic():
+                resolved, ingredients_created = self._resolve_ingredients(
+                    {key for record in records for key in record['ingredients']})
+                ingredient_ids = {**self.ingredient_ids, **resolved}
+
+                recipes = Recipe.objects.bulk_create(
+                    Recipe(title=record['title'], instructions=record['instructions'],
+                           created_by=self.user)
+                    for record in records)
+                recipe_ingredients = RecipeIngredient.objects.bulk_create(
+                    RecipeIngredient(recipe=recipe, ingredient_id=ingredient_ids[key],
+                                     quantity=quantity, created_by=self.user)
+                    for recipe, record in zip(recipes, records)
+                    for key, quantity in record['ingredients'].items())
+                RecipeService().refresh_search_vectors(
+                    Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]))
+        except IntegrityError as e:
+            if violated_constraint(e) not in ('recipe_unique_live_title',
+                                              'ingredient_unique_live_name_unit'):
+                raise
+            raise ValueError(
+                f"Records up to {checkpoint} conflict with recipes or ingredients created meanwhile")
+
+        transaction.on_commit(recipe_catalog.bump)
+        if ingredients_created:
+            transaction.on_commit(ingredient_catalog.bump)
+
+        # only ids from committed chunks are remembered
+        if len(self.ingredient_ids) + len(resolved) > self.ingredient_cache_size:
+            self.ingredient_ids.clear()
+        self.ingredient_ids.update(resolved)
+
+        self.stats['checkpoint'] = checkpoint
+        self.stats['recipes_created'] += len(recipes)
+        self.stats['recipes_skipped'] += len(chunk) - len(records)
+        self.stats['ingredients_created'] += ingredients_created
+        self.stats['recipe_ingredients_created'] += len(recipe_ingredients)
+        if self.progress is not None:
+            self.progress(self.stats)
+
+    def _resolve_ingredients(self, keys):
+        """
+        Returns the ids of the (name, unit) keys that are not cached yet,
+        looking up the live ingredients and creating the missing ones, and
+        how many were created.
+        """
+        missing = keys - self.ingredient_ids.keys()
+        if not missing:
+            return {}, 0
+
+        resolved = {}
+        for name, unit, id in Ingredient.objects.filter(
+                is_deleted=False, name__in={name for name, _ in missing}
+        ).values_list('name', 'unit', 'id'):
+            if (name, unit) in missing:
+                resolved[(name, unit)] = id
+
+        created = Ingredient.objects.bulk_create(
+            Ingredient(name=name, unit=unit, created_by=self.user)
+            for name, unit in missing - resolved.keys())
+        for ingredient in created:
+            resolved[(ingredient.name, ingredient.unit)] = ingredient.id
+        return resolved, len(created)
@@ -0,0 +1,86 @@
+import time
+from django.contrib.auth.models import User as AuthUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from recipes.fast_serializers import fast_recipe_list, fast_ingredient_list, fast_recipe_ingredient_list
+from recipes.models import Recipe, Ingredient, RecipeIngredient
+from recipes.serializers import RecipeSerializer, IngredientSerializer, RecipeIngredientSerializer
+from recipes.services import RecipeService, IngredientService, RecipeIngredientService
+
+
+class Command(BaseCommand):
+    help = (
+        "Times the recipe, ingredient and recipe ingredient lists through the "
+        "DRF serializers and through the fast serializers, and checks both "
+        "render the same JSON. Rows are seeded in a transaction that is "
+        "rolled back afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500,
+                            help="Rows to seed for each list.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Runs per path, the best run is reported.")
+
+    def handle(self, *args, **options):
+        if options['rows'] < 1 or options['repeat'] < 1:
+            raise CommandError("--rows and --repeat must be positive")
+
+        with transaction.atomic():
+            recipe = self.seed(options['rows'])
+            cases = [
+                ('recipes',
+                 lambda: RecipeSerializer(RecipeService().get_recipe_list(), many=True).data,
+                 lambda: fast_recipe_list.to_representation(
+                     RecipeService().get_recipe_list_rows(fast_recipe_list.columns))),
+                ('ingredients',
+                 lambda: IngredientSerializer(IngredientService().get_ingredient_list(), many=True).data,
+                 lambda: fast_ingredient_list.to_representation(
+                     IngredientService().get_ingredient_list_rows(fast_ingredient_list.columns))),
+                ('recipe ingredients',
+                 lambda: RecipeIngredientSerializer(
+                     RecipeIngredientService().get_recipe_ingredient_list(recipe.id), many=True).data,
+                 lambda: fast_recipe_ingredient_list.to_representation(
+                     RecipeIngredientService().get_recipe_ingredient_list_rows(
+                         recipe.id, fast_recipe_ingredient_list.columns))),
+            ]
+
+            renderer = JSONRenderer()
+            self.stdout.write(f"{'list':<20}{'drf ms':>10}{'fast ms':>10}{'speedup':>10}")
+            for name, drf, fast in cases:
+                if renderer.render(drf()) != renderer.render(fast()):
+                    raise CommandError(f"The {name} list renders differently on the fast path")
+                drf_time = self.best_of(drf, options['repeat'])
+                fast_time = self.best_of(fast, options['repeat'])
+                self.stdout.write(
+                    f"{name:<20}{drf_time * 1000:>10.1f}{fast_time * 1000:>10.1f}"
+                    f"{drf_time / fast_time:>9.1f}x")
+
+            transaction.set_rollback(True)
+
+    def seed(self, rows):
+        users = AuthUser.objects.bulk_create(
+            AuthUser(username=f'benchmark-{i}') for i in range(rows))
+        Recipe.objects.bulk_create(
+            Recipe(title=f'Benchmark recipe {i}', instructions='Mix.', created_by=user)
+            for i, user in enumerate(users))
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'Benchmark ingredient {i}', unit='g', created_by=user)
+            for i, user in enumerate(users))
+        recipe = Recipe.objects.create(
+            title='Benchmark recipe', instructions='Mix.', created_by=users[0])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, quantity=1.5, created_by=user)
+            for ingredient, user in zip(ingredients, users))
+        return recipe
+
+    @staticmethod
+    def best_of(run, repeat):
+        # the rendered list is included, as a response would force it too
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(run())
+            timings.append(time.perf_counter() - start)
+        return min(timings)
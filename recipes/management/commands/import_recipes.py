@@ -0,0 +1,62 @@
+import json
+import os
+from django.contrib.auth.models import User as AuthUser
+from django.core.management.base import BaseCommand, CommandError
+from recipes.imports import RecipeImportService
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports recipes with their ingredients from a JSON Lines or CSV file. "
+        "Progress is saved to a checkpoint file after every chunk, and running "
+        "the command again resumes after the last committed chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import (.jsonl, .ndjson or .csv).")
+        parser.add_argument('--user', required=True,
+                            help="Username the imported rows are created by.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'],
+                            help="File format, detected from the extension by default.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Recipes written per transaction.")
+        parser.add_argument('--checkpoint',
+                            help="Checkpoint file, <path>.checkpoint by default.")
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore an existing checkpoint and start from the first record.")
+
+    def handle(self, *args, **options):
+        try:
+            user = AuthUser.objects.get(username=options['user'])
+        except AuthUser.DoesNotExist:
+            raise CommandError(f"User {options['user']} not found")
+
+        checkpoint_path = options['checkpoint'] or f"{options['path']}.checkpoint"
+        resume_from = 0
+        if not options['restart'] and os.path.exists(checkpoint_path):
+            with open(checkpoint_path) as checkpoint_file:
+                resume_from = json.load(checkpoint_file)['checkpoint']
+            self.stdout.write(f"Resuming after record {resume_from}")
+
+        def progress(stats):
+            with open(checkpoint_path, 'w') as checkpoint_file:
+                json.dump(stats, checkpoint_file)
+            self.stdout.write(
+                "{checkpoint} records read, {recipes_created} recipes created, "
+                "{recipes_skipped} skipped, {ingredients_created} new ingredients".format(**stats))
+
+        try:
+            service = RecipeImportService(
+                user, chunk_size=options['chunk_size'], progress=progress)
+            format = options['format'] or service.detect_format(options['path'])
+            with open(options['path'], 'rb') as file:
+                stats = service.import_file(file, format, resume_from=resume_from)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        self.stdout.write(self.style.SUCCESS(
+            "Imported {recipes_created} recipes with {recipe_ingredients_created} "
+            "ingredients ({ingredients_created} new ingredients, {recipes_skipped} "
+            "recipes already present)".format(**stats)))
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.3 on 2026-10-18 09:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def rename_duplicates(model, fields, renamed_field, max_length):
+    live = model.objects.filter(is_deleted=False)
+    duplicates = live.order_by().values(*fields).annotate(
+        count=models.Count('id')).filter(count__gt=1).values_list(*fields)
+    for values in duplicates:
+        rows = live.filter(**dict(zip(fields, values))).order_by('-created_at', '-id')
+        for id, value in rows.values_list('id', renamed_field)[1:]:
+            suffix = f" ({id})"
+            model.objects.filter(id=id).update(
+                **{renamed_field: value[:max_length - len(suffix)] + suffix})
+
+
+def rename_live_duplicates(apps, schema_editor):
+    # updates never checked for duplicates, so live rows can already share a
+    # title or a name and unit. The newest keeps it, older ones get their id
+    # appended, which keeps every reference to them intact
+    rename_duplicates(apps.get_model('recipes', 'Recipe'), ['title'], 'title', 255)
+    rename_duplicates(apps.get_model('recipes', 'Ingredient'), ['name', 'unit'], 'name', 100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+        ('recipes', '0007_remove_ingredient_image_path_ingredient_image'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='ingredient_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['-created_at', '-id'], name='recipe_live_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['recipe', '-created_at'], name='recipeingr_live_recipe_idx'),
+        ),
+        migrations.RunPython(rename_live_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_deleted', False)), fields=('name', 'unit'), name='ingredient_unique_live_name_unit'),
+        ),
+        migrations.AddConstraint(
+            model_name='recipe',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_deleted', False)), fields=('title',), name='recipe_unique_live_title'),
+        ),
+    ]
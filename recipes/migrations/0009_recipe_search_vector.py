@@ -0,0 +1,51 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:03
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_search_vectors(apps, schema_editor):
+    # a frozen copy of recipes.search.recipe_search_vector as of this
+    # migration, so later changes to it or to SEARCH_CONFIG don't alter it
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeIngredient = apps.get_model('recipes', 'RecipeIngredient')
+    ingredient_names = RecipeIngredient.objects.filter(
+        recipe=OuterRef('pk'), is_deleted=False, ingredient__is_deleted=False
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', delimiter=' ')
+    ).values('names')
+    Recipe.objects.update(search_vector=(
+        SearchVector('title', weight='A', config='english')
+        + SearchVector('instructions', weight='B', config='english')
+        + SearchVector(Coalesce(Subquery(ingredient_names), Value(''),
+                                output_field=TextField()),
+                       weight='C', config='english')
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+        ('recipes', '0008_live_row_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_deleted', False)), fields=['search_vector'], name='recipe_live_search_idx'),
+        ),
+    ]
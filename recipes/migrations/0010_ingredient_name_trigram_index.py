@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 10:06
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+trigram_index = django.contrib.postgres.indexes.GinIndex(
+    condition=models.Q(('is_deleted', False)), fields=['name'],
+    name='ingredient_live_name_trgm_idx', opclasses=['gin_trgm_ops'])
+
+
+def create_trigram_index(apps, schema_editor):
+    # servers without the pg_trgm contrib module still migrate, ingredient
+    # autocomplete then falls back to an unindexed prefix match
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.add_index(apps.get_model('recipes', 'Ingredient'), trigram_index)
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute(f'DROP INDEX IF EXISTS "{trigram_index.name}"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+        ('recipes', '0009_recipe_search_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # database only: the index depends on pg_trgm being installed, so it is
+    # kept out of the model state rather than recorded as always present
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
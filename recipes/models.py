@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User as AuthUser
 from images.models import Image
 
@@ -14,6 +17,8 @@ class Recipe(models.Model):
         AuthUser, on_delete=models.CASCADE, related_name='recipes'
     )
     is_deleted = models.BooleanField(default=False)
+    # maintained by RecipeService.refresh_search_vectors
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return self.title
@@ -21,6 +26,16 @@ class Recipe(models.Model):
     class Meta:
         verbose_name = 'Recipe'
         verbose_name_plural = 'Recipes'
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_deleted=False),
+                         name='recipe_live_created_idx'),
+            GinIndex(fields=['search_vector'], condition=Q(is_deleted=False),
+                     name='recipe_live_search_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['title'], condition=Q(is_deleted=False),
+                                    name='recipe_unique_live_title'),
+        ]
 
 
 class Ingredient(models.Model):
@@ -42,6 +57,16 @@ class Ingredient(models.Model):
     class Meta:
         verbose_name = 'Ingredient'
         verbose_name_plural = 'Ingredients'
+        # the trigram index on name is created by migration 0010 where pg_trgm
+        # is available, and is kept out of the model state for that reason
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], condition=Q(is_deleted=False),
+                         name='ingredient_live_created_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['name', 'unit'], condition=Q(is_deleted=False),
+                                    name='ingredient_unique_live_name_unit'),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -63,3 +88,7 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Recipe Ingredient'
         verbose_name_plural = 'Recipe Ingredients'
+        indexes = [
+            models.Index(fields=['recipe', '-created_at'], condition=Q(is_deleted=False),
+                         name='recipeingr_live_recipe_idx'),
+        ]
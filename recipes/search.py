@@ -0,0 +1,44 @@
+from functools import cache
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db import connection
+from django.db.models import OuterRef, Subquery, TextField, Value
+from django.db.models.functions import Coalesce
+
+
+def recipe_search_vector(recipe_ingredient_model):
+    """
+    Weighted search document of a recipe for Recipe.objects.update(): the
+    title (A), the instructions (B) and the names of its ingredients (C).
+    """
+    ingredient_names = recipe_ingredient_model.objects.filter(
+        recipe=OuterRef('pk'), is_deleted=False, ingredient__is_deleted=False
+    ).values('recipe').annotate(
+        names=StringAgg('ingredient__name', delimiter=' ')
+    ).values('names')
+
+    config = settings.SEARCH_CONFIG
+    return (
+        SearchVector('title', weight='A', config=config)
+        + SearchVector('instructions', weight='B', config=config)
+        + SearchVector(Coalesce(Subquery(ingredient_names), Value(''),
+                                output_field=TextField()),
+                       weight='C', config=config)
+    )
+
+
+def recipe_search_query(text):
+    # websearch syntax: quoted phrases, "or" and -excluded words
+    return SearchQuery(text, search_type='websearch', config=settings.SEARCH_CONFIG)
+
+
+@cache
+def trigram_available():
+    """
+    Whether pg_trgm is installed in the database, checked once per process.
+    Migration 0010 only creates it where the server provides the module.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
@@ -3,28 +3,97 @@ from .models import Recipe, Ingredient, RecipeIngredient
 from users.serializers import UserSerializer
 
 
+class DynamicFieldsMixin:
+    """
+    List-mode serializer narrowed to the fields named in `fields`
+    (Meta.list_fields by default). Nested relations are only embedded when
+    named in `expand`, otherwise they render as their id.
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        selected = fields or self.Meta.list_fields
+        for name in list(self.fields):
+            if name not in selected:
+                self.fields.pop(name)
+            elif isinstance(self.fields[name], serializers.BaseSerializer) and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True)
+
+    @classmethod
+    def from_request(cls, request):
+        """
+        Builds the list serializer from ?fields= and ?expand=, or returns
+        None when the request asks for neither.
+        """
+        fields = request.query_params.get('fields')
+        expand = request.query_params.get('expand')
+        if fields is None and expand is None:
+            return None
+        return cls(
+            many=True,
+            fields=[name for name in (fields or '').split(',') if name],
+            expand=[name for name in (expand or '').split(',') if name]
+        )
+
+    def get_select_related(self):
+        """
+        Relations to join for the expanded fields, including the relations
+        their own serializers embed.
+        """
+        related = []
+        for name, field in self.fields.items():
+            if isinstance(field, serializers.BaseSerializer):
+                related.append(name)
+                related.extend(f"{name}__{nested}" for nested, nested_field in field.fields.items()
+                               if isinstance(nested_field, serializers.BaseSerializer))
+        return related
+
+    def get_columns(self):
+        """
+        Model columns needed to render the selected fields, for only().
+        Expanded relations are loaded in full.
+        """
+        model_fields = {
+            field.name for field in self.Meta.model._meta.concrete_fields}
+        expanded = set(self.get_select_related())
+        columns = set(self.Meta.list_columns)
+        columns.update(field.source for field in self.fields.values())
+        return sorted(
+            column for column in columns
+            if column.split('__')[0] in model_fields and not (
+                '__' in column and column.split('__')[0] in expanded)
+        )
+
+
 class RecipeSerializer(serializers.ModelSerializer):
     image_id = serializers.IntegerField(write_only=True, required=False)
     image_url = serializers.CharField(read_only=True, allow_null=True)
+    thumbnail_url = serializers.CharField(read_only=True, allow_null=True)
+    srcset = serializers.CharField(read_only=True, allow_null=True)
     created_by = UserSerializer(read_only=True)
 
     class Meta:
         model = Recipe
-        fields = '__all__'
+        exclude = ['search_vector']
         read_only_fields = ['id', 'created_at',
-                            'updated_at', 'created_by', 'image', 'image_url']
+                            'updated_at', 'created_by', 'image', 'image_url',
+                            'thumbnail_url', 'srcset']
 
 
 class IngredientSerializer(serializers.ModelSerializer):
     image_id = serializers.IntegerField(write_only=True, required=False)
     image_url = serializers.CharField(read_only=True, allow_null=True)
+    thumbnail_url = serializers.CharField(read_only=True, allow_null=True)
+    srcset = serializers.CharField(read_only=True, allow_null=True)
     created_by = UserSerializer(read_only=True)
 
     class Meta:
         model = Ingredient
         fields = '__all__'
         read_only_fields = ['id', 'created_at',
-                            'updated_at', 'created_by', 'image', 'image_url']
+                            'updated_at', 'created_by', 'image', 'image_url',
+                            'thumbnail_url', 'srcset']
 
 
 class RecipeIngredientSerializer(serializers.ModelSerializer):
@@ -32,12 +101,47 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
     ingredient = IngredientSerializer(read_only=True)
     created_by = UserSerializer(read_only=True)
     image_url = serializers.CharField(read_only=True)
+    thumbnail_url = serializers.CharField(read_only=True, allow_null=True)
+    srcset = serializers.CharField(read_only=True, allow_null=True)
 
     class Meta:
         model = RecipeIngredient
         fields = '__all__'
         read_only_fields = ['id', 'created_at', 'updated_at',
-                            'created_by', 'recipe', 'ingredient', 'image_url']
+                            'created_by', 'recipe', 'ingredient', 'image_url',
+                            'thumbnail_url', 'srcset']
+
+
+class RecipeListSerializer(DynamicFieldsMixin, RecipeSerializer):
+
+    class Meta(RecipeSerializer.Meta):
+        list_fields = ['id', 'title', 'image_url', 'thumbnail_url',
+                       'created_at', 'updated_at']
+        # pagination and image url resolution always need these
+        list_columns = ['id', 'created_at', 'image']
+
+
+class IngredientListSerializer(DynamicFieldsMixin, IngredientSerializer):
+
+    class Meta(IngredientSerializer.Meta):
+        list_fields = ['id', 'name', 'unit', 'image_url', 'thumbnail_url']
+        list_columns = ['id', 'created_at', 'image']
+
+
+class IngredientAutocompleteSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = Ingredient
+        fields = ['id', 'name', 'unit']
+
+
+class RecipeIngredientListSerializer(DynamicFieldsMixin, RecipeIngredientSerializer):
+
+    class Meta(RecipeIngredientSerializer.Meta):
+        list_fields = ['id', 'ingredient', 'quantity', 'image_url',
+                       'thumbnail_url']
+        # image urls are resolved from the ingredient, which is always joined
+        list_columns = ['id', 'created_at', 'ingredient', 'ingredient__image']
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -53,3 +157,11 @@ class RecipeIngredientUpdateSerializer(serializers.ModelSerializer):
 
     recipe_ingredient_id = serializers.IntegerField()
     quantity = serializers.FloatField()
+
+
+class CookableRecipeSerializer(serializers.Serializer):
+    recipe = RecipeSerializer(read_only=True)
+    ingredient_count = serializers.IntegerField()
+    matched_count = serializers.IntegerField()
+    missing_count = serializers.IntegerField()
+    coverage = serializers.FloatField()
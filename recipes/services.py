@@ -1,6 +1,33 @@
+from .cache import recipe_catalog, ingredient_catalog
+from .search import recipe_search_vector, recipe_search_query, trigram_available
 from .models import Recipe, Ingredient, RecipeIngredient
 from django.contrib.auth.models import User as AuthUser
-from images.services import ImageService
+from django.db import IntegrityError, transaction
+from django.contrib.postgres.search import SearchRank, TrigramWordSimilarity
+from django.db.models import Count, F, FloatField, Max, Q
+from django.db.models.functions import Cast, Greatest
+from recipebuilder.conditional import get_validators
+from images.services import ImageService, set_image_urls
+
+
+def violated_constraint(error):
+    """
+    Name of the constraint a database IntegrityError reports, or None when
+    the driver does not say.
+    """
+    diag = getattr(error.__cause__, 'diag', None)
+    return getattr(diag, 'constraint_name', None)
+
+
+def translate_integrity_error(error, unique_constraint, duplicate_message):
+    # foreign keys are checked at commit, an image deleted after it was
+    # validated surfaces here too
+    constraint = violated_constraint(error) or ''
+    if constraint == unique_constraint:
+        raise ValueError(duplicate_message) from error
+    if constraint.endswith('_fk_images_image_id'):
+        raise ValueError("Image not found") from error
+    raise error
 
 
 class RecipeService:
@@ -15,36 +42,116 @@ class RecipeService:
         if Recipe.objects.filter(title=title, is_deleted=False).exists():
             raise ValueError("A recipe with this title already exists")
 
+        image_service = ImageService(created_by)
+        image_urls = image_service.get_attachable_image_url_set(
+            image_id) if image_id else None
+
         recipe = Recipe(
             title=title,
             instructions=instructions,
             image_id=image_id,
             created_by=created_by
         )
-        recipe.save()
+        self._save_recipe(recipe)
+        set_image_urls(recipe, image_urls)
+        return recipe
 
-        image_service = ImageService(created_by)
-        image_url = image_service.get_image_url(image_id) if image_id else None
+    def get_recipe_list(self, paginator=None, only=None, select_related=('created_by',)):
+
+        list = Recipe.objects.filter(
+            is_deleted=False).defer('search_vector').order_by('-created_at')
+        if select_related:
+            list = list.select_related(*select_related)
+        if only is not None:
+            list = list.only(*only)
+        if paginator is not None:
+            list = paginator.paginate(list)
+        image_urls = ImageService().get_image_url_sets(
+            recipe.image_id for recipe in list)
+        for recipe in list:
+            set_image_urls(recipe, image_urls.get(recipe.image_id))
 
-        recipe.image_url = image_url
-        return recipe
+        return list
 
-    def get_recipe_list(self):
+    def get_recipe_list_rows(self, columns, paginator=None):
+        # plain values() rows for the fast list serializer
+        list = Recipe.objects.filter(
+            is_deleted=False).order_by('-created_at').values(*columns)
+        if paginator is not None:
+            list = paginator.paginate(list)
+        image_urls = ImageService().get_image_url_sets(row['image'] for row in list)
+        for row in list:
+            set_image_urls(row, image_urls.get(row['image']))
+        return list
 
-        list = Recipe.objects.filter(is_deleted=False).order_by('-created_at')
+    def search_recipes(self, query, paginator):
+        if not query or not query.strip():
+            raise ValueError("A search query is required")
+
+        search_query = recipe_search_query(query)
+        list = Recipe.objects.filter(
+            is_deleted=False, search_vector=search_query
+        ).annotate(
+            rank=SearchRank(F('search_vector'), search_query)
+        ).select_related('created_by').defer('search_vector').order_by('-rank', '-id')
+        list = paginator.paginate(list)
+        image_urls = ImageService().get_image_url_sets(
+            recipe.image_id for recipe in list)
         for recipe in list:
-            image_service = ImageService(recipe.created_by)
-            recipe.image_url = image_service.get_image_url(
-                recipe.image_id) if recipe.image_id else None
+            set_image_urls(recipe, image_urls.get(recipe.image_id))
+        return list
 
+    def get_cookable_recipes(self, ingredient_ids, paginator, max_missing=None):
+        if not ingredient_ids:
+            raise ValueError("At least one ingredient id is required")
+
+        # one grouped statement over the recipe ingredients, counting per
+        # recipe how many of its ingredients are on hand. Only recipes using
+        # at least one of them are grouped, found through the ingredient index
+        candidates = RecipeIngredient.objects.filter(
+            ingredient_id__in=ingredient_ids, is_deleted=False).values('recipe_id')
+        list = RecipeIngredient.objects.filter(
+            recipe_id__in=candidates, is_deleted=False, recipe__is_deleted=False
+        ).values('recipe_id').annotate(
+            ingredient_count=Count('ingredient_id', distinct=True),
+            matched_count=Count('ingredient_id', distinct=True,
+                                filter=Q(ingredient_id__in=ingredient_ids)),
+        ).annotate(
+            missing_count=F('ingredient_count') - F('matched_count'),
+            coverage=Cast('matched_count', FloatField()) /
+            Cast('ingredient_count', FloatField()),
+        ).order_by('-coverage', 'missing_count', '-recipe_id')
+        if max_missing is not None:
+            list = list.filter(missing_count__lte=max_missing)
+        list = paginator.paginate(list)
+
+        recipes = Recipe.objects.select_related('created_by').defer(
+            'search_vector').in_bulk(row['recipe_id'] for row in list)
+        image_urls = ImageService().get_image_url_sets(
+            recipe.image_id for recipe in recipes.values())
+        for row in list:
+            row['recipe'] = recipes[row['recipe_id']]
+            set_image_urls(row['recipe'], image_urls.get(row['recipe'].image_id))
         return list
 
+    def refresh_search_vectors(self, recipes):
+        # recomputes the stored search document of the given recipes, called
+        # whenever their title, instructions or ingredient names change
+        recipes.update(search_vector=recipe_search_vector(RecipeIngredient))
+
+    def get_recipe_list_validators(self):
+        return get_validators(Recipe.objects.all())
+
+    def get_recipe_validators(self, recipe_id):
+        return get_validators(Recipe.objects.filter(id=recipe_id))
+
     def get_recipe_by_id(self, recipe_id):
         try:
-            recipe = Recipe.objects.get(id=recipe_id, is_deleted=False)
+            recipe = Recipe.objects.select_related('created_by').defer('search_vector').get(
+                id=recipe_id, is_deleted=False)
             image_service = ImageService(recipe.created_by)
-            recipe.image_url = image_service.get_image_url(
-                recipe.image_id) if recipe.image_id else None
+            set_image_urls(recipe, image_service.get_image_url_set(
+                recipe.image_id) if recipe.image_id else None)
             return recipe
 
         except Recipe.DoesNotExist:
@@ -55,24 +162,39 @@ class RecipeService:
             recipe = Recipe.objects.get(id=recipe_id, is_deleted=False)
             recipe.is_deleted = True
             recipe.save()
+            transaction.on_commit(recipe_catalog.bump)
             return True
         except Recipe.DoesNotExist:
             raise ValueError("Recipe not found")
 
     def update_recipe(self, recipe_id, title, instructions, image_id=None):
         try:
-            recipe = Recipe.objects.get(id=recipe_id, is_deleted=False)
+            recipe = Recipe.objects.select_related('created_by').get(
+                id=recipe_id, is_deleted=False)
             recipe.title = title
             recipe.instructions = instructions
             recipe.image_id = image_id
             image_service = ImageService(recipe.created_by)
-            recipe.image_url = image_service.get_image_url(
-                image_id) if image_id else None
-            recipe.save()
+            set_image_urls(recipe, image_service.get_attachable_image_url_set(
+                image_id) if image_id else None)
+            self._save_recipe(recipe)
             return recipe
         except Recipe.DoesNotExist:
             raise ValueError("Recipe not found")
 
+    def _save_recipe(self, recipe):
+        # titles are unique among live recipes, the partial unique index
+        # catches what the existence check misses
+        try:
+            with transaction.atomic():
+                recipe.save()
+                self.refresh_search_vectors(
+                    Recipe.objects.filter(pk=recipe.pk))
+        except IntegrityError as e:
+            translate_integrity_error(
+                e, 'recipe_unique_live_title', "A recipe with this title already exists")
+        transaction.on_commit(recipe_catalog.bump)
+
 
 class IngredientService:
     def create_ingredient(self, name, unit, image_id=None, created_by=None):
@@ -87,38 +209,77 @@ class IngredientService:
             raise ValueError(
                 "An ingredient with this name and unit already exists")
 
+        image_service = ImageService(created_by)
+        image_urls = image_service.get_attachable_image_url_set(
+            image_id) if image_id else None
+
         ingredient = Ingredient(
             name=name,
             unit=unit,
             image_id=image_id,
             created_by=created_by
         )
-        ingredient.save()
-
-        image_service = ImageService(created_by)
-        image_url = image_service.get_image_url(image_id) if image_id else None
-
-        ingredient.image_url = image_url
+        self._save_ingredient(ingredient)
+        set_image_urls(ingredient, image_urls)
 
         return ingredient
 
-    def get_ingredient_list(self):
+    def get_ingredient_list(self, paginator=None, only=None, select_related=('created_by',)):
 
         list = Ingredient.objects.filter(
             is_deleted=False).order_by('-created_at')
+        if select_related:
+            list = list.select_related(*select_related)
+        if only is not None:
+            list = list.only(*only)
+        if paginator is not None:
+            list = paginator.paginate(list)
+        image_urls = ImageService().get_image_url_sets(
+            ingredient.image_id for ingredient in list)
         for ingredient in list:
-            image_service = ImageService(ingredient.created_by)
-            ingredient.image_url = image_service.get_image_url(
-                ingredient.image_id) if ingredient.image_id else None
+            set_image_urls(ingredient, image_urls.get(ingredient.image_id))
         return list
 
+    def get_ingredient_list_rows(self, columns, paginator=None):
+        list = Ingredient.objects.filter(
+            is_deleted=False).order_by('-created_at').values(*columns)
+        if paginator is not None:
+            list = paginator.paginate(list)
+        image_urls = ImageService().get_image_url_sets(row['image'] for row in list)
+        for row in list:
+            set_image_urls(row, image_urls.get(row['image']))
+        return list
+
+    def autocomplete_ingredients(self, query, limit):
+        query = (query or '').strip()
+        if not query:
+            raise ValueError("A search query is required")
+
+        list = Ingredient.objects.filter(is_deleted=False)
+        if trigram_available():
+            # word similarity matches the typed text against any part of the
+            # name, so prefixes and small typos both score, and the <%
+            # operator is answered from the trigram index
+            list = list.filter(name__trigram_word_similar=query).annotate(
+                similarity=TrigramWordSimilarity(query, 'name')
+            ).order_by('-similarity', 'name')
+        else:
+            list = list.filter(name__istartswith=query).order_by('name')
+        return list.values('id', 'name', 'unit')[:limit]
+
+    def get_ingredient_list_validators(self):
+        return get_validators(Ingredient.objects.all())
+
+    def get_ingredient_validators(self, ingredient_id):
+        return get_validators(Ingredient.objects.filter(id=ingredient_id))
+
     def get_ingredient_by_id(self, ingredient_id):
         try:
-            ingredient = Ingredient.objects.get(
+            ingredient = Ingredient.objects.select_related('created_by').get(
                 id=ingredient_id, is_deleted=False)
             image_service = ImageService(ingredient.created_by)
-            ingredient.image_url = image_service.get_image_url(
-                ingredient.image_id) if ingredient.image_id else None
+            set_image_urls(ingredient, image_service.get_image_url_set(
+                ingredient.image_id) if ingredient.image_id else None)
 
             return ingredient
 
@@ -131,25 +292,42 @@ class IngredientService:
                 id=ingredient_id, is_deleted=False)
             ingredient.is_deleted = True
             ingredient.save()
+            self._refresh_recipes_using(ingredient)
+            transaction.on_commit(ingredient_catalog.bump)
             return True
         except Ingredient.DoesNotExist:
             raise ValueError("Ingredient not found")
 
     def update_ingredient(self, ingredient_id, name, unit, image_id=None):
         try:
-            ingredient = Ingredient.objects.get(
+            ingredient = Ingredient.objects.select_related('created_by').get(
                 id=ingredient_id, is_deleted=False)
             ingredient.name = name
             ingredient.unit = unit
             ingredient.image_id = image_id
             image_service = ImageService(ingredient.created_by)
-            ingredient.image_url = image_service.get_image_url(
-                image_id) if image_id else None
-            ingredient.save()
+            set_image_urls(ingredient, image_service.get_attachable_image_url_set(
+                image_id) if image_id else None)
+            self._save_ingredient(ingredient)
+            self._refresh_recipes_using(ingredient)
             return ingredient
         except Ingredient.DoesNotExist:
             raise ValueError("Ingredient not found")
 
+    def _save_ingredient(self, ingredient):
+        try:
+            with transaction.atomic():
+                ingredient.save()
+        except IntegrityError as e:
+            translate_integrity_error(
+                e, 'ingredient_unique_live_name_unit',
+                "An ingredient with this name and unit already exists")
+        transaction.on_commit(ingredient_catalog.bump)
+
+    def _refresh_recipes_using(self, ingredient):
+        RecipeService().refresh_search_vectors(
+            Recipe.objects.filter(recipe_ingredients__ingredient=ingredient))
+
 
 class RecipeIngredientService:
     def create_recipe_ingredient(self, recipe_id, ingredient_list, created_by=None):
@@ -158,39 +336,74 @@ class RecipeIngredientService:
             raise ValueError("A valid user must be provided")
 
         recipe = RecipeService().get_recipe_by_id(recipe_id)
+
+        # validate the whole batch with one query and report every missing id
+        ingredient_ids = {item['ingredient_id'] for item in ingredient_list}
+        ingredients = Ingredient.objects.filter(
+            is_deleted=False).select_related('created_by').in_bulk(ingredient_ids)
+        missing_ids = sorted(ingredient_ids - ingredients.keys())
+        if missing_ids:
+            raise ValueError(
+                f"Ingredients not found: {', '.join(str(id) for id in missing_ids)}")
+
+        image_urls = ImageService().get_image_url_sets(
+            ingredient.image_id for ingredient in ingredients.values())
         recipe_ingredient_list = []
 
         for item in ingredient_list:
-
-            ingredient = IngredientService().get_ingredient_by_id(
-                item['ingredient_id'])
-            quantity = item['quantity']
+            ingredient = ingredients[item['ingredient_id']]
             recipe_ingredient = RecipeIngredient(
                 recipe=recipe,
                 ingredient=ingredient,
-                quantity=quantity,
+                quantity=item['quantity'],
                 created_by=created_by)
-            image_service = ImageService(created_by)
-            recipe_ingredient.image_url = image_service.get_image_url(
-                ingredient.image_id) if ingredient.image_id else None
-
+            set_image_urls(recipe_ingredient, image_urls.get(ingredient.image_id))
             recipe_ingredient_list.append(recipe_ingredient)
 
-        return RecipeIngredient.objects.bulk_create(recipe_ingredient_list)
+        with transaction.atomic():
+            recipe_ingredient_list = RecipeIngredient.objects.bulk_create(
+                recipe_ingredient_list)
+            RecipeService().refresh_search_vectors(
+                Recipe.objects.filter(pk=recipe.pk))
+        return recipe_ingredient_list
 
-    def get_recipe_ingredient_list(self, recipe_id):
+    def get_recipe_ingredient_list(self, recipe_id, only=None,
+                                   select_related=('created_by', 'recipe__created_by', 'ingredient__created_by')):
 
         try:
+            # the ingredient is always joined, image urls are resolved from it
             list = RecipeIngredient.objects.filter(
-                recipe_id=recipe_id, is_deleted=False).order_by('-created_at')
+                recipe_id=recipe_id, is_deleted=False).select_related(
+                    'ingredient', *select_related).defer(
+                        'recipe__search_vector').order_by('-created_at')
+            if only is not None:
+                list = list.only(*only)
+            image_urls = ImageService().get_image_url_sets(
+                recipe_ingredient.ingredient.image_id for recipe_ingredient in list)
             for recipe_ingredient in list:
-                image_service = ImageService(recipe_ingredient.created_by)
-                recipe_ingredient.image_url = image_service.get_image_url(
-                    recipe_ingredient.ingredient.image_id) if recipe_ingredient.ingredient.image_id else None
+                set_image_urls(recipe_ingredient, image_urls.get(
+                    recipe_ingredient.ingredient.image_id))
             return list
         except RecipeIngredient.DoesNotExist:
             raise ValueError("Recipe ingredients not found")
 
+    def get_recipe_ingredient_list_rows(self, recipe_id, columns):
+        list = RecipeIngredient.objects.filter(
+            recipe_id=recipe_id, is_deleted=False).order_by('-created_at').values(*columns)
+        image_urls = ImageService().get_image_url_sets(
+            row['ingredient__image'] for row in list)
+        for row in list:
+            set_image_urls(row, image_urls.get(row['ingredient__image']))
+        return list
+
+    def get_recipe_ingredient_list_validators(self, recipe_id):
+        # rows embed their recipe and ingredient, so edits to those count too
+        return get_validators(
+            RecipeIngredient.objects.filter(recipe_id=recipe_id),
+            last_modified=Max(Greatest(
+                'updated_at', 'recipe__updated_at', 'ingredient__updated_at'))
+        )
+
     def delete_recipe_ingredient(self, recipe_ingredient_id):
 
         recipe_ingredient = RecipeIngredient.objects.filter(
@@ -199,6 +412,8 @@ class RecipeIngredientService:
             raise ValueError("Recipe ingredient not found")
         recipe_ingredient.is_deleted = True
         recipe_ingredient.save()
+        RecipeService().refresh_search_vectors(
+            Recipe.objects.filter(pk=recipe_ingredient.recipe_id))
         return True
 
     def update_recipe_ingredient(self, recipe_ingredient_id, quantity):
@@ -208,8 +423,8 @@ class RecipeIngredientService:
             recipe_ingredient.quantity = quantity
             recipe_ingredient.save()
             image_service = ImageService(recipe_ingredient.created_by)
-            recipe_ingredient.image_url = image_service.get_image_url(
-                recipe_ingredient.ingredient.image_id) if recipe_ingredient.ingredient.image_id else None
+            set_image_urls(recipe_ingredient, image_service.get_image_url_set(
+                recipe_ingredient.ingredient.image_id) if recipe_ingredient.ingredient.image_id else None)
 
             return recipe_ingredient
         except RecipeIngredient.DoesNotExist:
@@ -217,11 +432,12 @@ class RecipeIngredientService:
 
     def get_recipe_ingredient_by_id(self, recipe_ingredient_id):
         try:
-            recipe_ingredient = RecipeIngredient.objects.get(
+            recipe_ingredient = RecipeIngredient.objects.select_related(
+                'created_by', 'recipe__created_by', 'ingredient__created_by').get(
                 id=recipe_ingredient_id, is_deleted=False)
             image_service = ImageService(recipe_ingredient.created_by)
-            recipe_ingredient.image_url = image_service.get_image_url(
-                recipe_ingredient.ingredient.image_id) if recipe_ingredient.ingredient.image_id else None
+            set_image_urls(recipe_ingredient, image_service.get_image_url_set(
+                recipe_ingredient.ingredient.image_id) if recipe_ingredient.ingredient.image_id else None)
             return recipe_ingredient
 
         except RecipeIngredient.DoesNotExist:
@@ -242,8 +458,8 @@ class RecipeIngredientService:
             existing_item.created_by = created_by
             existing_item.save()
             image_service = ImageService(created_by)
-            existing_item.image_url = image_service.get_image_url(
-                ingredient.image_id) if ingredient.image_id else None
+            set_image_urls(existing_item, image_service.get_image_url_set(
+                ingredient.image_id) if ingredient.image_id else None)
 
             return existing_item
 
@@ -255,8 +471,10 @@ class RecipeIngredientService:
                 created_by=created_by
             )
             recipe_ingredient.save()
+            RecipeService().refresh_search_vectors(
+                Recipe.objects.filter(pk=recipe.pk))
             image_service = ImageService(created_by)
-            recipe_ingredient.image_url = image_service.get_image_url(
-                ingredient.image_id) if ingredient.image_id else None
+            set_image_urls(recipe_ingredient, image_service.get_image_url_set(
+                ingredient.image_id) if ingredient.image_id else None)
 
             return recipe_ingredient
@@ -1,3 +1,469 @@
-from django.test import TestCase
+import io
+import json
+from unittest import mock
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from recipebuilder.metrics import registry
+from recipebuilder.testing import AuthenticatedAPITestCase, QueryCountAssertions, enable_catalog_cache
+from .imports import RecipeImportService
+from .models import Recipe, Ingredient, RecipeIngredient
+from .search import trigram_available
+from .services import RecipeService, IngredientService
 
-# Create your tests here.
+
+class RecipeQueryCountTests(QueryCountAssertions, AuthenticatedAPITestCase):
+
+    def test_recipe_list(self):
+        # validators, recipes with their creators, then their images
+        self.assertConstantQueries(3, '/recipes/recipe/', self.data.recipe)
+
+    def test_ingredient_list(self):
+        self.assertConstantQueries(
+            3, '/recipes/ingredient/', self.data.ingredient)
+
+    def test_recipe_ingredient_list(self):
+        recipe = self.data.recipe()
+        # validators, rows joined to recipe, ingredient and all creators,
+        # then images
+        self.assertConstantQueries(
+            3, f'/recipes/recipe/{recipe.id}/ingredient/', lambda: self.data.recipe_ingredient(recipe))
+
+    def test_recipe_detail(self):
+        recipe = self.data.recipe()
+        self.assertConstantQueries(
+            3, f'/recipes/recipe/{recipe.id}/', lambda: self.data.recipe_ingredient(recipe))
+
+    def test_ingredient_detail(self):
+        ingredient = self.data.ingredient()
+        # validators, the ingredient with its creator, then its image, however
+        # many recipes use it
+        self.assertConstantQueries(
+            3, f'/recipes/ingredient/{ingredient.id}/',
+            lambda: self.data.recipe_ingredient(self.data.recipe(), ingredient))
+
+
+class RecipeIngredientBatchTests(AuthenticatedAPITestCase):
+
+    def test_create_batch_runs_fixed_queries(self):
+        recipe = self.data.recipe()
+        ingredients = [self.data.ingredient() for _ in range(20)]
+        payload = [{'ingredient_id': ingredient.id, 'quantity': 2}
+                   for ingredient in ingredients]
+
+        # recipe, recipe image, ingredients, ingredient images, and the
+        # insert and the search vector refresh inside their savepoint
+        with self.assertNumQueries(8):
+            response = self.client.post(
+                f'/recipes/recipe/{recipe.id}/ingredient/', payload, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()['data']), 20)
+        self.assertEqual(recipe.recipe_ingredients.count(), 20)
+
+    def test_create_batch_reports_all_missing_ingredients(self):
+        recipe = self.data.recipe()
+        payload = [
+            {'ingredient_id': self.data.ingredient().id, 'quantity': 1},
+            {'ingredient_id': 998, 'quantity': 1},
+            {'ingredient_id': 999, 'quantity': 1},
+        ]
+        response = self.client.post(
+            f'/recipes/recipe/{recipe.id}/ingredient/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'],
+                         "Ingredients not found: 998, 999")
+        self.assertFalse(recipe.recipe_ingredients.exists())
+
+
+class RecipeSaveErrorTests(AuthenticatedAPITestCase):
+
+    def test_only_the_unique_title_reads_as_a_duplicate(self):
+        existing = self.data.recipe()
+        with self.assertRaisesMessage(ValueError, "A recipe with this title already exists"):
+            RecipeService()._save_recipe(
+                Recipe(title=existing.title, instructions='Mix.', created_by=self.user))
+
+        # foreign keys are deferred to commit, check them at once here
+        with connection.cursor() as cursor:
+            cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+        with self.assertRaisesMessage(ValueError, "Image not found"):
+            RecipeService()._save_recipe(
+                Recipe(title='Soup', instructions='Boil.', image_id=999, created_by=self.user))
+        with self.assertRaisesMessage(ValueError, "Image not found"):
+            IngredientService()._save_ingredient(
+                Ingredient(name='Salt', unit='g', image_id=999, created_by=self.user))
+
+
+class LiveDuplicateMigrationTests(TransactionTestCase):
+    before = [('recipes', '0007_remove_ingredient_image_path_ingredient_image')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_older_live_duplicates_are_renamed(self):
+        apps = self.migrate(self.before)
+        Recipe = apps.get_model('recipes', 'Recipe')
+        Ingredient = apps.get_model('recipes', 'Ingredient')
+        user = apps.get_model('auth', 'User').objects.create(username='owner@example.com')
+        older, newer = (Recipe.objects.create(title='Soup', instructions='Boil.', created_by=user)
+                        for _ in range(2))
+        deleted = Recipe.objects.create(
+            title='Soup', instructions='Boil.', created_by=user, is_deleted=True)
+        salt = [Ingredient.objects.create(name='Salt', unit=unit, created_by=user)
+                for unit in ('g', 'g', 'kg')]
+
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+        self.assertEqual(dict(Recipe.objects.values_list('id', 'title')), {
+            older.id: f'Soup ({older.id})', newer.id: 'Soup', deleted.id: 'Soup'})
+        self.assertEqual(list(Ingredient.objects.order_by('id').values_list('name', flat=True)),
+                         [f'Salt ({salt[0].id})', 'Salt', 'Salt'])
+
+
+@enable_catalog_cache
+class CatalogCacheTests(AuthenticatedAPITestCase):
+
+    def test_cached_until_catalog_changes(self):
+        self.data.recipe()
+        first = self.client.get('/recipes/recipe/')
+        with self.assertNumQueries(0):
+            cached = self.client.get('/recipes/recipe/')
+        self.assertEqual(cached.json(), first.json())
+        self.assertEqual(cached['ETag'], first['ETag'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/recipes/recipe/', {'title': 'Soup', 'instructions': 'Boil.'}, format='json')
+        changed = self.client.get('/recipes/recipe/')
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual(len(changed.json()['data']), 2)
+
+    def test_if_none_match_returns_not_modified(self):
+        recipe = self.data.recipe()
+        response = self.client.get(f'/recipes/recipe/{recipe.id}/')
+        with self.assertNumQueries(0):
+            response = self.client.get(
+                f'/recipes/recipe/{recipe.id}/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_if_modified_since_returns_not_modified(self):
+        recipe = self.data.recipe()
+        url = f'/recipes/recipe/{recipe.id}/'
+        response = self.client.get(url)
+        last_modified = response['Last-Modified']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # on a miss the validators are checked before the view body runs
+        cache.clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_errors_are_not_cached(self):
+        response = self.client.get('/recipes/ingredient/999/')
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(response.has_header('ETag'))
+
+
+class UncachedCatalogTests(AuthenticatedAPITestCase):
+
+    def test_responses_follow_the_rows_without_a_shared_cache(self):
+        recipe = self.data.recipe()
+        url = f'/recipes/recipe/{recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        # only the validators query runs
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # no cached copy or catalog version to invalidate, the next read
+        # sees the write even though no commit hook ran
+        self.client.put(url, {'title': 'Broth', 'instructions': 'Simmer.'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['data']['title'], 'Broth')
+
+
+class ListFieldSelectionTests(AuthenticatedAPITestCase):
+
+    def test_fields_narrow_the_response_and_the_columns(self):
+        self.data.recipe()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/recipes/recipe/?fields=id,title')
+        self.assertEqual(list(response.json()['data'][0]), ['id', 'title'])
+        recipe_query = next(query['sql'] for query in queries.captured_queries
+                            if 'FROM "recipes_recipe"' in query['sql'] and 'MAX(' not in query['sql'])
+        self.assertNotIn('instructions', recipe_query)
+        self.assertNotIn('auth_user', recipe_query)
+
+    def test_relations_render_as_ids_unless_expanded(self):
+        recipe = self.data.recipe()
+        recipe_ingredient = self.data.recipe_ingredient(recipe)
+        url = f'/recipes/recipe/{recipe.id}/ingredient/'
+        compact = self.client.get(url, {'fields': 'id,ingredient'}).json()['data'][0]
+        expanded = self.client.get(url, {'expand': 'ingredient'}).json()['data'][0]
+        self.assertEqual(
+            compact, {'id': recipe_ingredient.id, 'ingredient': recipe_ingredient.ingredient_id})
+        self.assertEqual(expanded['ingredient']['name'],
+                         recipe_ingredient.ingredient.name)
+        self.assertEqual(set(expanded), {'id', 'ingredient', 'quantity', 'image_url', 'thumbnail_url'})
+
+
+class FastListSerializationTests(AuthenticatedAPITestCase):
+
+    def get_both(self, url):
+        bodies = []
+        for fast in (False, True):
+            cache.clear()
+            with override_settings(FAST_LIST_SERIALIZATION=fast):
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            bodies.append(response.content)
+        return bodies
+
+    def test_fast_path_renders_identical_json(self):
+        recipe = self.data.recipe()
+        for _ in range(3):
+            self.data.recipe()
+            self.data.recipe_ingredient(recipe)
+        for url in ('/recipes/recipe/?page_size=2', '/recipes/ingredient/',
+                    f'/recipes/recipe/{recipe.id}/ingredient/'):
+            drf, fast = self.get_both(url)
+            self.assertEqual(fast, drf, url)
+
+
+class RecipeSearchTests(AuthenticatedAPITestCase):
+
+    def search(self, query, **params):
+        return self.client.get('/recipes/recipe/search/', {'q': query, **params})
+
+    def create_recipe(self, title, instructions):
+        response = self.client.post(
+            '/recipes/recipe/', {'title': title, 'instructions': instructions}, format='json')
+        return response.json()['data']['id']
+
+    def test_ranks_title_above_instructions_and_ingredients(self):
+        in_instructions = self.create_recipe('Tomato salad', 'Top with basil.')
+        in_title = self.create_recipe('Basil pesto', 'Blend.')
+        by_ingredient = self.create_recipe('Green sauce', 'Blend.')
+        self.create_recipe('Plain rice', 'Boil.')
+        basil = Ingredient.objects.create(name='Basil', unit='g', created_by=self.user)
+        self.client.post(f'/recipes/recipe/{by_ingredient}/ingredient/',
+                         [{'ingredient_id': basil.id, 'quantity': 1}], format='json')
+
+        ids = [recipe['id'] for recipe in self.search('basil').json()['data']]
+        self.assertEqual(ids, [in_title, in_instructions, by_ingredient])
+
+        first = self.search('basil', page_size=2).json()
+        second = self.search('basil', page_size=2, cursor=first['next_cursor']).json()
+        self.assertEqual([recipe['id'] for recipe in first['data'] + second['data']], ids)
+        self.assertIsNone(second['next_cursor'])
+        self.assertNotIn('search_vector', first['data'][0])
+
+    def test_requires_a_query(self):
+        self.assertEqual(self.search('  ').status_code, 400)
+
+
+class CookableRecipeTests(AuthenticatedAPITestCase):
+
+    def test_ranks_by_coverage_in_one_aggregate(self):
+        full = self.data.recipe()
+        partial = self.data.recipe()
+        unrelated = self.data.recipe()
+        on_hand = [self.data.recipe_ingredient(full).ingredient_id,
+                   self.data.recipe_ingredient(full).ingredient_id]
+        RecipeIngredient.objects.create(
+            recipe=partial, ingredient_id=on_hand[0], quantity=1, created_by=self.user)
+        self.data.recipe_ingredient(partial)
+        self.data.recipe_ingredient(unrelated)
+
+        # the aggregate, the page's recipes and their images
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/recipes/recipe/cookable/', {'ingredients': ','.join(map(str, on_hand))})
+        rows = response.json()['data']
+        self.assertEqual([row['recipe']['id'] for row in rows], [full.id, partial.id])
+        self.assertEqual(rows[1]['coverage'], 0.5)
+        self.assertEqual(rows[1]['missing_count'], 1)
+
+        response = self.client.get(
+            '/recipes/recipe/cookable/', {'ingredients': on_hand[0], 'max_missing': 0})
+        self.assertEqual(response.json()['data'], [])
+
+    def test_rejects_invalid_ids(self):
+        response = self.client.get('/recipes/recipe/cookable/', {'ingredients': '1,x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_invalid_max_missing(self):
+        for max_missing in ('-1', 'two', '1.5'):
+            with self.subTest(max_missing=max_missing):
+                response = self.client.get(
+                    '/recipes/recipe/cookable/', {'ingredients': '1', 'max_missing': max_missing})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(
+                    response.json()['error'], "max_missing must be a non-negative integer")
+
+
+@enable_catalog_cache
+class IngredientAutocompleteTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('Tomato', 'Tomato paste', 'Potato', 'Thyme'):
+            Ingredient.objects.create(name=name, unit='g', created_by=self.user)
+
+    def test_returns_limited_compact_matches(self):
+        response = self.client.get('/recipes/ingredient/autocomplete/', {'q': 'tom', 'limit': 1})
+        data = response.json()['data']
+        self.assertEqual(len(data), 1)
+        self.assertEqual(set(data[0]), {'id', 'name', 'unit'})
+        self.assertEqual(data[0]['name'], 'Tomato')
+
+        # the same keystroke is served from the ingredient catalog cache
+        with self.assertNumQueries(0):
+            self.client.get('/recipes/ingredient/autocomplete/', {'q': 'tom', 'limit': 1})
+
+    def test_rejects_empty_query(self):
+        response = self.client.get('/recipes/ingredient/autocomplete/', {'q': ' '})
+        self.assertEqual(response.status_code, 400)
+
+    def test_uses_trigram_word_similarity_when_available(self):
+        with mock.patch('recipes.services.trigram_available', return_value=True):
+            query = str(IngredientService().autocomplete_ingredients('tom', 5).query)
+        self.assertIn('%>', query)
+        self.assertIn('WORD_SIMILARITY', query.upper())
+
+    def test_trigram_matches_tolerate_typos(self):
+        if not trigram_available():
+            self.skipTest("pg_trgm is not installed")
+        names = [row['name'] for row in IngredientService().autocomplete_ingredients('tomatp', 5)]
+        self.assertEqual(names[:2], ['Tomato', 'Tomato paste'])
+
+
+class RecipeImportTests(AuthenticatedAPITestCase):
+
+    def test_csv_upload_dedupes_ingredients_and_skips_existing_titles(self):
+        self.data.recipe()
+        existing = Recipe.objects.get()
+        Ingredient.objects.create(name='Salt', unit='g', created_by=self.user)
+        csv = (
+            "title,instructions,ingredient_name,ingredient_unit,quantity\n"
+            "Soup,Boil.,Salt,g,2\n"
+            "Soup,Boil.,Water,ml,500\n"
+            "Bread,Bake.,Salt,g,5\n"
+            f"{existing.title},Mix.,Salt,g,1\n"
+        )
+        response = self.client.post('/recipes/recipe/import/', {
+            'file': SimpleUploadedFile('catalog.csv', csv.encode())}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['data'], {
+            'checkpoint': 3, 'recipes_created': 2, 'recipes_skipped': 1,
+            'ingredients_created': 1, 'recipe_ingredients_created': 3})
+        self.assertEqual(Ingredient.objects.filter(name='Salt').count(), 1)
+        self.assertEqual(
+            Recipe.objects.get(title='Soup').recipe_ingredients.count(), 2)
+
+    def test_bad_record_keeps_committed_chunks_and_resumes(self):
+        lines = [f'{{"title": "Recipe {i}", "instructions": "Mix.", '
+                 f'"ingredients": [{{"name": "Flour", "unit": "g", "quantity": {i}}}]}}'
+                 for i in range(1, 6)]
+        lines[3] = '{"title": "Broken"}'
+        progress = []
+        service = RecipeImportService(self.user, chunk_size=2, progress=progress.append)
+        with self.assertRaisesMessage(ValueError, "Record 4: title and instructions are required"):
+            service.import_file(io.BytesIO('\n'.join(lines).encode()), 'jsonl')
+        self.assertEqual(service.stats['checkpoint'], 2)
+        self.assertEqual(Recipe.objects.count(), 2)
+
+        lines[3] = '{"title": "Fixed", "instructions": "Mix."}'
+        stats = RecipeImportService(self.user, chunk_size=2).import_file(
+            io.BytesIO('\n'.join(lines).encode()), 'jsonl', resume_from=2)
+        self.assertEqual(stats['recipes_created'], 3)
+        self.assertEqual(Recipe.objects.count(), 5)
+        self.assertEqual(Ingredient.objects.filter(name='Flour').count(), 1)
+        self.assertEqual(len(progress), 1)
+
+    def test_records_of_the_wrong_shape_are_rejected(self):
+        cases = [
+            ('{"title": 5, "instructions": "Mix."}', "Record 1: title must be a string"),
+            ('{"title": "Soup", "instructions": ["Boil."]}',
+             "Record 1: instructions must be a string"),
+            ('{"title": "Soup", "instructions": "Boil.", "ingredients": {"name": "Salt"}}',
+             "Record 1: ingredients must be a list"),
+            ('{"title": "Soup", "instructions": "Boil.", "ingredients": ["Salt"]}',
+             "Record 1: each ingredient must be an object"),
+            ('{"title": "Soup", "instructions": "Boil.", '
+             '"ingredients": [{"name": "Salt", "unit": 1, "quantity": 2}]}',
+             "Record 1: ingredient unit must be a string"),
+            (json.dumps({'title': 'T' * 256, 'instructions': 'Boil.'}),
+             "Record 1: title is too long (at most 255 characters)"),
+            (json.dumps({'title': 'Soup', 'instructions': 'Boil.', 'ingredients': [
+                {'name': 'N' * 101, 'unit': 'g', 'quantity': 1}]}),
+             "Record 1: ingredient name is too long (at most 100 characters)"),
+            (json.dumps({'title': 'Soup', 'instructions': 'Boil.', 'ingredients': [
+                {'name': 'Salt', 'unit': 'U' * 51, 'quantity': 1}]}),
+             "Record 1: ingredient unit is too long (at most 50 characters)"),
+        ]
+        for line, message in cases:
+            with self.subTest(line=line), self.assertRaisesMessage(ValueError, message):
+                RecipeImportService(self.user).import_file(io.BytesIO(line.encode()), 'jsonl')
+        self.assertFalse(Recipe.objects.exists())
+
+
+class RecipeExportTests(AuthenticatedAPITestCase):
+
+    def export(self, format):
+        response = self.client.get('/recipes/recipe/export/', {'file_format': format})
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_export_round_trips_through_import(self):
+        recipe = self.data.recipe()
+        self.data.recipe_ingredient(recipe)
+        self.data.recipe_ingredient(recipe)
+        deleted = self.data.recipe_ingredient(recipe)
+        deleted.is_deleted = True
+        deleted.save()
+        self.data.recipe()
+
+        with self.assertNumQueries(1):
+            lines = self.export('jsonl').decode().splitlines()
+        exported = [json.loads(line) for line in lines]
+        self.assertEqual(len(exported), 2)
+        self.assertEqual(len(exported[0]['ingredients']), 2)
+        self.assertEqual(exported[1]['ingredients'], [])
+
+        csv = self.export('csv')
+        self.assertEqual(csv.count(b'\n'), 1 + 2 + 1)
+        Recipe.objects.update(is_deleted=True)
+        stats = RecipeImportService(self.user).import_file(io.BytesIO(csv), 'csv')
+        self.assertEqual(stats['recipes_created'], 2)
+        self.assertEqual(stats['recipe_ingredients_created'], 2)
+
+
+class RequestMetricsTests(AuthenticatedAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_records_queries_per_url_name(self):
+        self.data.recipe()
+        response = self.client.get('/recipes/recipe/')
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="3 queries"', response['Server-Timing'])
+
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+        metrics = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+        self.assertIn(
+            'recipebuilder_request_db_queries_bucket{endpoint="recipe-list",method="GET",le="3"} 1',
+            metrics)
+        self.assertIn(
+            'recipebuilder_request_duration_seconds_count{endpoint="recipe-list",method="GET"} 1',
+            metrics)
@@ -1,11 +1,17 @@
 from django.urls import path
-from .views import RecipeView, RecipeDetailView, IngredientView, IngredientDetailView, RecipeIngredientView, AddSingleRecipeIngredientView
+from .views import RecipeView, RecipeSearchView, CookableRecipeView, RecipeImportView, RecipeExportView, RecipeDetailView, IngredientView, IngredientAutocompleteView, IngredientDetailView, RecipeIngredientView, AddSingleRecipeIngredientView
 
 urlpatterns = [
     path('recipe/', RecipeView.as_view(), name='recipe-list'),
+    path('recipe/search/', RecipeSearchView.as_view(), name='recipe-search'),
+    path('recipe/cookable/', CookableRecipeView.as_view(), name='recipe-cookable'),
+    path('recipe/import/', RecipeImportView.as_view(), name='recipe-import'),
+    path('recipe/export/', RecipeExportView.as_view(), name='recipe-export'),
     path('recipe/<int:recipe_id>/',
          RecipeDetailView.as_view(), name='recipe-detail'),
     path('ingredient/', IngredientView.as_view(), name='ingredient-list'),
+    path('ingredient/autocomplete/', IngredientAutocompleteView.as_view(),
+         name='ingredient-autocomplete'),
     path('ingredient/<int:ingredient_id>/',
          IngredientDetailView.as_view(), name='ingredient-detail'),
     path('recipe/<int:recipe_id>/ingredient/',
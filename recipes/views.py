@@ -1,17 +1,46 @@
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import RecipeSerializer, IngredientSerializer,  RecipeIngredientSerializer, RecipeIngredientCreateSerializer, RecipeIngredientUpdateSerializer
+from .serializers import RecipeSerializer, IngredientSerializer,  RecipeIngredientSerializer, RecipeIngredientCreateSerializer, RecipeIngredientUpdateSerializer, RecipeListSerializer, IngredientListSerializer, RecipeIngredientListSerializer, CookableRecipeSerializer, IngredientAutocompleteSerializer
 from .services import RecipeService, IngredientService, RecipeIngredientService
+from .imports import RecipeImportService
+from .exports import RecipeExportService
+from .fast_serializers import fast_recipe_list, fast_ingredient_list, fast_recipe_ingredient_list
+from .cache import cache_catalog_response, recipe_catalog, ingredient_catalog
+from recipebuilder.conditional import conditional_get
+from recipebuilder.pagination import KeysetPaginator, OffsetPaginator
 
 
 class RecipeView(APIView):
 
+    def get_validators(self, request):
+        return RecipeService().get_recipe_list_validators()
+
+    @cache_catalog_response(recipe_catalog)
     def get(self, request):
+        try:
+            paginator = KeysetPaginator.from_request(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         service = RecipeService()
-        recipes = service.get_recipe_list()
-        serializer = RecipeSerializer(recipes, many=True)
-        return Response({'data': serializer.data}, status=status.HTTP_200_OK)
+        serializer = RecipeListSerializer.from_request(request)
+        if serializer is not None:
+            serializer.instance = service.get_recipe_list(
+                paginator,
+                only=serializer.child.get_columns(),
+                select_related=serializer.child.get_select_related()
+            )
+            data = serializer.data
+        elif settings.FAST_LIST_SERIALIZATION:
+            rows = service.get_recipe_list_rows(
+                fast_recipe_list.columns, paginator)
+            data = fast_recipe_list.to_representation(rows)
+        else:
+            recipes = service.get_recipe_list(paginator)
+            data = RecipeSerializer(recipes, many=True).data
+        return Response({'data': data, 'next_cursor': paginator.next_cursor}, status=status.HTTP_200_OK)
 
     def post(self, request):
         serializer = RecipeSerializer(data=request.data)
@@ -31,8 +60,94 @@ class RecipeView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class RecipeSearchView(APIView):
+
+    def get(self, request):
+        try:
+            paginator = OffsetPaginator.from_request(request)
+            recipes = RecipeService().search_recipes(
+                request.query_params.get('q'), paginator)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = RecipeSerializer(recipes, many=True)
+        return Response({'data': serializer.data, 'next_cursor': paginator.next_cursor}, status=status.HTTP_200_OK)
+
+
+class CookableRecipeView(APIView):
+
+    def get(self, request):
+        try:
+            paginator = OffsetPaginator.from_request(request)
+            ingredient_ids = self.parse_ids(request.query_params.get('ingredients', ''))
+            max_missing = self.parse_max_missing(request.query_params.get('max_missing'))
+            recipes = RecipeService().get_cookable_recipes(
+                ingredient_ids, paginator, max_missing=max_missing)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = CookableRecipeSerializer(recipes, many=True)
+        return Response({'data': serializer.data, 'next_cursor': paginator.next_cursor}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def parse_ids(value):
+        try:
+            return {int(id) for id in value.split(',') if id.strip()}
+        except ValueError:
+            raise ValueError("ingredients must be a comma-separated list of ids")
+
+    @staticmethod
+    def parse_max_missing(value):
+        if value in (None, ''):
+            return None
+        try:
+            max_missing = int(value)
+        except ValueError:
+            raise ValueError("max_missing must be a non-negative integer")
+        if max_missing < 0:
+            raise ValueError("max_missing must be a non-negative integer")
+        return max_missing
+
+
+class RecipeImportView(APIView):
+
+    def post(self, request):
+        file = request.FILES.get('file')
+        if not file:
+            return Response({"error": "No file provided"}, status=status.HTTP_400_BAD_REQUEST)
+        service = None
+        try:
+            service = RecipeImportService(user=request.user)
+            format = request.data.get('file_format') or service.detect_format(file.name)
+            stats = service.import_file(
+                file, format, resume_from=int(request.data.get('resume_from') or 0))
+            return Response({'data': stats, 'message': 'Recipes imported successfully'}, status=status.HTTP_201_CREATED)
+        except ValueError as e:
+            # earlier chunks are committed, the client resumes from the checkpoint
+            checkpoint = service.stats['checkpoint'] if service else 0
+            return Response({"error": str(e), "checkpoint": checkpoint}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RecipeExportView(APIView):
+
+    def get(self, request):
+        # ?format= is taken by DRF's renderer negotiation
+        format = request.query_params.get('file_format', 'jsonl')
+        service = RecipeExportService()
+        try:
+            content_type = service.content_type(format)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        # rows are written as the cursor yields them, nothing is buffered
+        response = StreamingHttpResponse(service.stream(format), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="recipes.{format}"'
+        return response
+
+
 class RecipeDetailView(APIView):
 
+    def get_validators(self, request, recipe_id):
+        return RecipeService().get_recipe_validators(recipe_id)
+
+    @cache_catalog_response(recipe_catalog)
     def get(self, request, recipe_id):
         try:
             service = RecipeService()
@@ -74,12 +189,32 @@ class RecipeDetailView(APIView):
 
 class IngredientView(APIView):
 
-    def get(self, request):
+    def get_validators(self, request):
+        return IngredientService().get_ingredient_list_validators()
 
+    @cache_catalog_response(ingredient_catalog)
+    def get(self, request):
+        try:
+            paginator = KeysetPaginator.from_request(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         service = IngredientService()
-        ingredients = service.get_ingredient_list()
-        serializer = IngredientSerializer(ingredients, many=True)
-        return Response({'data': serializer.data}, status=status.HTTP_200_OK)
+        serializer = IngredientListSerializer.from_request(request)
+        if serializer is not None:
+            serializer.instance = service.get_ingredient_list(
+                paginator,
+                only=serializer.child.get_columns(),
+                select_related=serializer.child.get_select_related()
+            )
+            data = serializer.data
+        elif settings.FAST_LIST_SERIALIZATION:
+            rows = service.get_ingredient_list_rows(
+                fast_ingredient_list.columns, paginator)
+            data = fast_ingredient_list.to_representation(rows)
+        else:
+            ingredients = service.get_ingredient_list(paginator)
+            data = IngredientSerializer(ingredients, many=True).data
+        return Response({'data': data, 'next_cursor': paginator.next_cursor}, status=status.HTTP_200_OK)
 
     def post(self, request):
         serializer = IngredientSerializer(data=request.data)
@@ -100,8 +235,37 @@ class IngredientView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class IngredientAutocompleteView(APIView):
+
+    @cache_catalog_response(ingredient_catalog)
+    def get(self, request):
+        try:
+            ingredients = IngredientService().autocomplete_ingredients(
+                request.query_params.get('q'), self.parse_limit(request.query_params.get('limit')))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = IngredientAutocompleteSerializer(ingredients, many=True)
+        return Response({'data': serializer.data}, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def parse_limit(limit):
+        if limit in (None, ''):
+            return settings.AUTOCOMPLETE_LIMIT
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError("limit must be a positive integer")
+        if limit < 1:
+            raise ValueError("limit must be a positive integer")
+        return min(limit, settings.AUTOCOMPLETE_MAX_LIMIT)
+
+
 class IngredientDetailView(APIView):
 
+    def get_validators(self, request, ingredient_id):
+        return IngredientService().get_ingredient_validators(ingredient_id)
+
+    @cache_catalog_response(ingredient_catalog)
     def get(self, request, ingredient_id):
         try:
             service = IngredientService()
@@ -159,15 +323,33 @@ class RecipeIngredientView(APIView):
                 return Response({'data': serialized_recipe_ingredient, 'message': 'Recipe ingredient created successfully'}, status=status.HTTP_201_CREATED)
             except ValueError as e:
                 return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    def get_validators(self, request, recipe_id):
+        return RecipeIngredientService().get_recipe_ingredient_list_validators(recipe_id)
 
+    @conditional_get(signed_urls=True)
     def get(self, request, recipe_id):
         try:
             service = RecipeIngredientService()
-            recipe_ingredients = service.get_recipe_ingredient_list(
-                recipe_id)
-            serializer = RecipeIngredientSerializer(
-                recipe_ingredients, many=True)
-            return Response({'data': serializer.data}, status=status.HTTP_200_OK)
+            serializer = RecipeIngredientListSerializer.from_request(request)
+            if serializer is not None:
+                serializer.instance = service.get_recipe_ingredient_list(
+                    recipe_id,
+                    only=serializer.child.get_columns(),
+                    select_related=serializer.child.get_select_related()
+                )
+                data = serializer.data
+            elif settings.FAST_LIST_SERIALIZATION:
+                rows = service.get_recipe_ingredient_list_rows(
+                    recipe_id, fast_recipe_ingredient_list.columns)
+                data = fast_recipe_ingredient_list.to_representation(rows)
+            else:
+                recipe_ingredients = service.get_recipe_ingredient_list(
+                    recipe_id)
+                data = RecipeIngredientSerializer(
+                    recipe_ingredients, many=True).data
+            return Response({'data': data}, status=status.HTTP_200_OK)
         except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_404_NOT_FOUND)
 